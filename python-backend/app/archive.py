@@ -0,0 +1,229 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime, timezone
+from importlib import metadata
+from typing import Any, Dict, Optional
+
+import asyncpg
+import numpy as np
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Embedding, Event, Image
+
+# Bump when the layout of the arrays below changes.
+ARCHIVE_FORMAT = 1
+MODEL_NAME = "ArcFace"
+EMBEDDING_DIM = 512
+# model_info() keys that may differ between deployments: the vectors stay
+# comparable, but drift slightly, so an import only warns about them
+MODEL_VARIANT_KEYS = ("detector", "deepface_version", "face_backend", "onnx_int8")
+
+
+def _deepface_version() -> Optional[str]:
+    try:
+        return metadata.version("deepface")
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def model_info() -> Dict[str, Any]:
+    """
+    What produced the stored vectors; an archive is only importable into a
+    deployment whose vectors are comparable.
+    """
+    return {
+        "model_name": MODEL_NAME,
+        "dim": EMBEDDING_DIM,
+        "detector": os.getenv("FACE_DETECTOR", "retinaface"),
+        "normalization": MODEL_NAME,
+        "deepface_version": _deepface_version(),
+        "face_backend": os.getenv("FACE_BACKEND", "deepface"),
+        "onnx_int8": os.getenv("ONNX_INT8", "0") == "1",
+    }
+
+
+async def export_event(db: AsyncSession, event_id: int) -> bytes:
+    """
+    Packs an event's image metadata, bboxes and vectors into a compressed
+    .npz archive (columnar arrays, no pickled objects). The photos
+    themselves are not included.
+    """
+    ev = await db.get(Event, event_id)
+    q = await db.execute(
+        select(Image.id, Image.path, Image.media_type)
+        .where(Image.event_id == event_id)
+        .order_by(Image.id)
+    )
+    images = q.all()
+    position = {row.id: i for i, row in enumerate(images)}
+
+    n = (await db.execute(
+        select(func.count(Embedding.id)).where(Embedding.event_id == event_id)
+    )).scalar_one()
+    emb_image = np.zeros(n, dtype=np.int32)
+    bboxes = np.zeros((n, 4), dtype=np.float32)
+    quality = np.full(n, np.nan, dtype=np.float32)
+    timestamps = np.full(n, np.nan, dtype=np.float32)
+    vectors = np.zeros((n, EMBEDDING_DIM), dtype=np.float32)
+    has_vector = np.zeros(n, dtype=bool)
+
+    # stream rows straight into the preallocated columns
+    result = await db.stream(
+        select(
+            Embedding.image_id, Embedding.x, Embedding.y, Embedding.w, Embedding.h,
+            Embedding.quality, Embedding.timestamp, Embedding.vector,
+        )
+        .where(Embedding.event_id == event_id)
+        .order_by(Embedding.id)
+    )
+    i = 0
+    async for row in result:
+        if i >= n:
+            break
+        emb_image[i] = position[row.image_id]
+        bboxes[i] = (row.x, row.y, row.w, row.h)
+        if row.quality is not None:
+            quality[i] = row.quality
+        if row.timestamp is not None:
+            timestamps[i] = row.timestamp
+        if row.vector is not None:
+            vectors[i] = row.vector
+            has_vector[i] = True
+        i += 1
+
+    meta = {
+        "format": ARCHIVE_FORMAT,
+        "exported_at": datetime.now(timezone.utc).isoformat(),
+        "model": model_info(),
+        "event": {
+            "title": ev.title,
+            "date": ev.date.isoformat(),
+            "description": ev.description,
+        },
+    }
+    arrays = {
+        "meta": np.array(json.dumps(meta)),
+        "image_paths": np.array([row.path for row in images], dtype=str),
+        "image_media_types": np.array([row.media_type for row in images], dtype=str),
+        "emb_image": emb_image[:i],
+        "bboxes": bboxes[:i],
+        "quality": quality[:i],
+        "timestamps": timestamps[:i],
+        "vectors": vectors[:i],
+        "has_vector": has_vector[:i],
+    }
+
+    def pack() -> bytes:
+        buf = io.BytesIO()
+        np.savez_compressed(buf, **arrays)
+        return buf.getvalue()
+
+    return await run_in_threadpool(pack)
+
+
+def _read_archive(data: bytes) -> Dict[str, Any]:
+    try:
+        with np.load(io.BytesIO(data), allow_pickle=False) as npz:
+            arrays = {name: npz[name] for name in npz.files}
+        meta = json.loads(str(arrays.pop("meta")))
+    except (ValueError, KeyError, OSError) as e:
+        raise HTTPException(400, detail=f"Invalid archive: {e}")
+    if meta.get("format") != ARCHIVE_FORMAT:
+        raise HTTPException(400, detail=f"Unsupported archive format {meta.get('format')}")
+    model = meta.get("model", {})
+    if model.get("model_name") != MODEL_NAME or model.get("dim") != EMBEDDING_DIM:
+        raise HTTPException(
+            400, detail=f"Archive vectors come from {model}, expected {MODEL_NAME}/{EMBEDDING_DIM}")
+    ours = model_info()
+    drift = {k: (model.get(k), ours[k]) for k in MODEL_VARIANT_KEYS if model.get(k) != ours[k]}
+    if drift:
+        print(f"Importing vectors from another model setup (archive, here): {drift}")
+    arrays["meta"] = meta
+    return arrays
+
+
+def _csv(rows) -> bytes:
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    return buf.getvalue().encode()
+
+
+def _embedding_csv(arrays: Dict[str, Any], event_id: int, image_ids: np.ndarray) -> bytes:
+    def fmt(v: float) -> str:
+        return "" if np.isnan(v) else repr(float(v))
+
+    rows = (
+        (
+            event_id,
+            int(image_ids[img]),
+            *(float(v) for v in bbox),
+            fmt(q),
+            fmt(t),
+            "[" + ",".join(map(repr, vec.tolist())) + "]" if ok else "",
+        )
+        for img, bbox, q, t, vec, ok in zip(
+            arrays["emb_image"], arrays["bboxes"], arrays["quality"],
+            arrays["timestamps"], arrays["vectors"], arrays["has_vector"],
+        )
+    )
+    return _csv(rows)
+
+
+async def import_event(db: AsyncSession, data: bytes, user_id: str) -> Event:
+    """
+    Recreates an exported event without running inference: images and
+    embeddings are bulk-loaded with COPY in a single transaction. Photos
+    are expected to be restored into IMAGE_DIR separately.
+    """
+    arrays = await run_in_threadpool(_read_archive, data)
+    meta = arrays["meta"]["event"]
+    paths = arrays["image_paths"]
+
+    ev = Event(
+        user_id=user_id,
+        title=meta["title"],
+        date=datetime.fromisoformat(meta["date"]),
+        description=meta.get("description"),
+    )
+    db.add(ev)
+    await db.flush()
+
+    # reserve image ids up front so embeddings can reference them in COPY
+    q = await db.execute(
+        text("SELECT nextval(pg_get_serial_sequence('images', 'id')) "
+             "FROM generate_series(1, :n)"),
+        {"n": len(paths)},
+    )
+    image_ids = np.array(q.scalars().all(), dtype=np.int64)
+
+    images_csv = await run_in_threadpool(_csv, (
+        (int(image_id), str(path), ev.id, str(media_type))
+        for image_id, path, media_type in zip(
+            image_ids, paths, arrays["image_media_types"])
+    ))
+    embeddings_csv = await run_in_threadpool(_embedding_csv, arrays, ev.id, image_ids)
+
+    conn = await db.connection()
+    raw = (await conn.get_raw_connection()).driver_connection
+    try:
+        await raw.copy_to_table(
+            "images", source=io.BytesIO(images_csv), format="csv",
+            columns=["id", "path", "event_id", "media_type"],
+        )
+        await raw.copy_to_table(
+            "embeddings", source=io.BytesIO(embeddings_csv), format="csv",
+            columns=["event_id", "image_id", "x", "y", "w", "h", "quality", "timestamp", "vector"],
+        )
+    except asyncpg.UniqueViolationError as e:
+        await db.rollback()
+        raise HTTPException(409, detail=f"Archive conflicts with existing images: {e}")
+
+    # COPY has kept the partition's ivfflat index up to date row by row
+    await db.commit()
+    await db.refresh(ev)
+    return ev
@@ -0,0 +1,125 @@
+import asyncio
+import math
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+QUERY_BATCH_SIZE = int(os.getenv("QUERY_BATCH_SIZE", "8"))
+QUERY_BATCH_WAIT_MS = float(os.getenv("QUERY_BATCH_WAIT_MS", "5"))
+QUERY_QUEUE_SIZE = int(os.getenv("QUERY_QUEUE_SIZE", "64"))
+
+
+class QueueFull(Exception):
+    """
+    Raised by MicroBatcher.submit when the queue is saturated;
+    `retry_after` is a rough estimate (seconds) of when it will drain.
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class MicroBatcher:
+    """
+    Collects concurrent requests for up to `max_wait_ms` (or until
+    `max_batch` are waiting), runs them through `batch_fn` together and
+    fans the results back to each caller. At most `max_queue` requests may
+    wait; beyond that submit() fails fast with QueueFull instead of letting
+    latency grow without bound.
+
+    `batch_fn` reports the failure of a single item by returning the
+    exception in that item's slot: only its caller gets it. An exception
+    raised by `batch_fn` itself fails the whole batch.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch: int = QUERY_BATCH_SIZE,
+        max_wait_ms: float = QUERY_BATCH_WAIT_MS,
+        max_queue: int = QUERY_QUEUE_SIZE,
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.items = 0
+        self.rejected = 0
+        self._avg_batch_seconds = 0.0
+
+    def _ensure_started(self) -> asyncio.Queue:
+        # the queue and worker task must belong to the running event loop
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+        return self._queue
+
+    def retry_after(self) -> int:
+        pending_batches = math.ceil((self._queue.qsize() if self._queue else 0) / self.max_batch)
+        return max(1, math.ceil((pending_batches + 1) * self._avg_batch_seconds))
+
+    async def submit(self, item: Any) -> Any:
+        queue = self._ensure_started()
+        fut = asyncio.get_running_loop().create_future()
+        try:
+            queue.put_nowait((item, fut))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFull(self.retry_after())
+        return await fut
+
+    async def _collect(self) -> List[Tuple[Any, asyncio.Future]]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            # callers that gave up (client disconnected) are not computed
+            batch = [(item, fut) for item, fut in batch if not fut.cancelled()]
+            if not batch:
+                continue
+            started = time.monotonic()
+            try:
+                results = await self.batch_fn([item for item, _ in batch])
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+            else:
+                for (_, fut), result in zip(batch, results):
+                    if fut.done():
+                        continue
+                    if isinstance(result, BaseException):
+                        fut.set_exception(result)
+                    else:
+                        fut.set_result(result)
+            elapsed = time.monotonic() - started
+            self._avg_batch_seconds = 0.8 * self._avg_batch_seconds + 0.2 * elapsed \
+                if self.batches else elapsed
+            self.batches += 1
+            self.items += len(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "avg_batch_seconds": self._avg_batch_seconds,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+        }
@@ -1,14 +1,30 @@
+import base64
+import os
 from operator import and_
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from uuid import UUID
 import numpy as np
-from sqlalchemy import select, func
+from sqlalchemy import (
+    select, func, text, literal, tuple_, values, column, true, cast, Integer, update, delete
+)
+from sqlalchemy.orm import aliased
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql.functions import user
-from .models import Image, Embedding, Event
+from pgvector.sqlalchemy import Vector
+from .models import (
+    EMBEDDING_IVF_LISTS, Image, Embedding, Event, Subscription, SubscriptionMatch
+)
 from .schemas import EmbeddingIn, EventIn
-from deepface import DeepFace
+from .vector_ops import distance_matrix
+from .thresholds import find_threshold
+
+# Event filters matching at most this many embeddings are searched with an
+# exact scan of just those rows instead of the global ivfflat index.
+EXACT_SCAN_MAX_ROWS = int(os.getenv("EXACT_SCAN_MAX_ROWS", "50000"))
+# ivfflat probes for the first ANN round, doubled on every expansion
+ANN_PROBES = int(os.getenv("ANN_PROBES", "10"))
+ANN_MAX_FETCH = int(os.getenv("ANN_MAX_FETCH", "20000"))
 
 
 async def create_event(
@@ -45,6 +61,35 @@ async def get_event(
     return q.scalars().first()
 
 
+async def get_event_version(
+    db: AsyncSession,
+    event_id: int
+) -> Optional[int]:
+    """
+    Current photo-set version of an Event, None if it does not exist.
+    """
+    q = await db.execute(
+        select(Event.version).where(Event.id == event_id)
+    )
+    return q.scalar_one_or_none()
+
+
+async def bump_event_version(
+    db: AsyncSession,
+    event_id: int
+) -> None:
+    """
+    Marks the event's photo set as changed, which invalidates every cached
+    match result keyed on the previous version.
+    """
+    await db.execute(
+        update(Event)
+        .where(Event.id == event_id)
+        .values(version=Event.version + 1)
+    )
+    await db.commit()
+
+
 async def get_all_events(
     db: AsyncSession,
     limit: int = 100,
@@ -95,26 +140,75 @@ async def delete_event(
     db: AsyncSession,
     event_id: int,
     user_id: str,
-) -> bool:
+) -> Optional[List[str]]:
     """
-    Delete one Event by its ID. Returns True if deleted, False if not found.
+    Delete one Event by its ID. Returns the paths of its image files (to be
+    removed from disk by the caller), or None if not found.
     """
-    q = await db.execute(
-        select(Event).where(and_(Event.id == event_id, Event.user_id == user_id))
+    deleted, paths = await delete_events_bulk(db, [event_id], user_id)
+    if not deleted:
+        return None
+    return paths
+
+
+async def delete_events_bulk(
+    db: AsyncSession,
+    event_ids: List[int],
+    user_id: str,
+) -> Tuple[List[int], List[str]]:
+    """
+    Set-based delete of the user's events among `event_ids`, with their
+    images and embeddings, in one transaction. Returns the deleted event
+    ids and the image paths whose files are now unreferenced.
+    """
+    owned = select(Event.id).where(
+        and_(Event.id.in_(event_ids), Event.user_id == user_id)
     )
-    ev = q.scalars().first()
-    if not ev:
-        return False
+    q = await db.execute(owned)
+    ids = list(q.scalars().all())
+    if not ids:
+        return [], []
+
+    await db.execute(delete(Embedding).where(Embedding.event_id.in_(ids)))
+    res = await db.execute(
+        delete(Image).where(Image.event_id.in_(ids)).returning(Image.path)
+    )
+    paths = list(res.scalars().all())
+    await db.execute(delete(Event).where(Event.id.in_(ids)))
+    await db.commit()
+    return ids, paths
+
 
-    await db.delete(ev)
+async def delete_images_bulk(
+    db: AsyncSession,
+    image_ids: List[int],
+    user_id: str,
+) -> Tuple[List[int], List[str]]:
+    """
+    Set-based delete of the given images (restricted to events owned by
+    the user) and their embeddings, in one transaction. Returns the ids of
+    the affected events and the deleted image paths.
+    """
+    owned_events = select(Event.id).where(Event.user_id == user_id)
+    await db.execute(
+        delete(Embedding).where(and_(
+            Embedding.image_id.in_(image_ids), Embedding.event_id.in_(owned_events)
+        ))
+    )
+    res = await db.execute(
+        delete(Image)
+        .where(and_(Image.id.in_(image_ids), Image.event_id.in_(owned_events)))
+        .returning(Image.path, Image.event_id)
+    )
+    rows = res.all()
     await db.commit()
-    return True
+    return sorted({r.event_id for r in rows}), [r.path for r in rows]
 
 
 async def get_or_create_image(
-    db: AsyncSession, path: str, event_id: int
+    db: AsyncSession, path: str, event_id: int, media_type: str = "image"
 ) -> Image:
-    stmt = pg_insert(Image).values(path=path, event_id=event_id)
+    stmt = pg_insert(Image).values(path=path, event_id=event_id, media_type=media_type)
     stmt = stmt.on_conflict_do_nothing(
         index_elements=[Image.path]
     ).returning(Image.id)
@@ -131,6 +225,39 @@ async def get_or_create_image(
     return await db.get(Image, image_id)
 
 
+async def recent_image_hashes(
+    db: AsyncSession, event_id: int, exclude_id: int, limit: int
+) -> List[Tuple[int, int]]:
+    """
+    (id, phash) of the event's latest hashed photos that are not
+    duplicates themselves: the candidate burst representatives.
+    """
+    q = await db.execute(
+        select(Image.id, Image.phash)
+        .where(
+            Image.event_id == event_id,
+            Image.id != exclude_id,
+            Image.media_type == "image",
+            Image.phash.isnot(None),
+            Image.duplicate_of.is_(None),
+        )
+        .order_by(Image.id.desc())
+        .limit(limit)
+    )
+    return [tuple(r) for r in q.all()]
+
+
+async def set_image_hash(
+    db: AsyncSession, image_id: int, phash: int, duplicate_of: Optional[int] = None
+) -> None:
+    await db.execute(
+        update(Image)
+        .where(Image.id == image_id)
+        .values(phash=phash, duplicate_of=duplicate_of)
+    )
+    await db.commit()
+
+
 async def get_image(
     db: AsyncSession, image_id: int
 ) -> Image:
@@ -152,15 +279,24 @@ async def get_all_images(
 
 
 async def add_embedding(
-    db: AsyncSession, image_id: int, bbox: dict, vector: np.ndarray
+    db: AsyncSession,
+    event_id: int,
+    image_id: int,
+    bbox: dict,
+    vector: Optional[np.ndarray],
+    quality: Optional[float] = None,
+    timestamp: Optional[float] = None,
 ) -> Embedding:
     emb = Embedding(
+        event_id=event_id,
         image_id=image_id,
         x=bbox["x"],
         y=bbox["y"],
         w=bbox["w"],
         h=bbox["h"],
         vector=vector,
+        quality=quality,
+        timestamp=timestamp,
     )
     db.add(emb)
     await db.commit()
@@ -194,62 +330,588 @@ async def list_embeddings(
     return q.scalars().all()
 
 
+async def list_embeddings_for_images(
+    db: AsyncSession, image_ids: List[int]
+) -> Dict[int, List[Embedding]]:
+    """
+    Embeddings of several images in one query, grouped by image_id.
+    """
+    out: Dict[int, List[Embedding]] = {i: [] for i in image_ids}
+    if not image_ids:
+        return out
+    q = await db.execute(
+        select(Embedding)
+        .where(Embedding.image_id.in_(set(image_ids)))
+        .order_by(Embedding.image_id, Embedding.id)
+    )
+    for e in q.scalars().all():
+        out[e.image_id].append(e)
+    return out
+
+
+async def count_event_embeddings(
+    db: AsyncSession, event_ids: List[int]
+) -> int:
+    q = await db.execute(
+        select(func.count(Embedding.id))
+        .where(Embedding.event_id.in_(event_ids))
+    )
+    return q.scalar_one()
+
+
+def _group_id(image=Image):
+    # a burst of near-duplicate photos counts as one image in search results
+    return func.coalesce(image.duplicate_of, image.id).label("group_id")
+
+
+def _match_dict(r, threshold: float) -> Dict[str, Any]:
+    return {
+        "embedding_id": r["embedding_id"],
+        "image_id":     r["image_id"],
+        "image_path":   r["image_path"],
+        "distance":     r["distance"],
+        "threshold":    threshold,
+        "bbox": {
+            "x": r["x"], "y": r["y"],
+            "w": r["w"], "h": r["h"],
+        },
+        "timestamp":    r["timestamp"],
+    }
+
+
+def encode_cursor(cursor: Tuple[float, int]) -> str:
+    """
+    Opaque page token for find_similar: the (distance, embedding id) of the
+    last match returned.
+    """
+    distance, emb_id = cursor
+    return base64.urlsafe_b64encode(f"{distance!r}:{emb_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[float, int]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        distance, emb_id = raw.split(":")
+        return float(distance), int(emb_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def _next_ann_round(
+    rows: List[Any], fetch: int, probes: int, threshold: float, exact: bool = False
+) -> Optional[Tuple[int, int]]:
+    """
+    (fetch, probes) for the next round of a distance-ordered read, or None
+    once it has seen every match under the threshold. A short read only
+    proves that when the scan covered every row (exact, or probes >=
+    EMBEDDING_IVF_LISTS); from ivfflat it may just mean the probed lists
+    ran out, so more lists are probed with the same LIMIT.
+    """
+    if rows and rows[-1]["distance"] > threshold:
+        return None
+    complete = exact or probes >= EMBEDDING_IVF_LISTS
+    if len(rows) < fetch:
+        return None if complete else (fetch, min(probes * 2, EMBEDDING_IVF_LISTS))
+    if fetch >= ANN_MAX_FETCH:
+        return None
+    return fetch * 4, min(probes * 2, EMBEDDING_IVF_LISTS)
+
+
 async def find_similar(
     db: AsyncSession,
     vector: List[float],
     event_id: int,
     limit: int = 5,
     metric: str = "cosine",
-) -> List[Dict[str, Any]]:
-    # 1) threshold and convenience alias
-    threshold = DeepFace.verification.find_threshold("ArcFace", metric)
-    vec = vector
+    min_quality: Optional[float] = None,
+    cursor: Optional[Tuple[float, int]] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[Tuple[float, int]]]:
+    """
+    Up to `limit` images of the event, each with its closest face under the
+    threshold, ordered by (distance, embedding id). Near-duplicate burst
+    photos collapse into the best matching one. Returns the matches and the
+    cursor of the next page (None when there is none).
+
+    Faces are read in distance order with a plain ORDER BY ... LIMIT, from
+    the ivfflat index (or an exact scan of a small event), and the LIMIT
+    grows until `limit` distinct images are found or the threshold is
+    passed. A cursor resumes the scan after the last returned face and
+    skips images already returned on an earlier page.
+    """
+    threshold = find_threshold("ArcFace", metric)
+    n_rows = await count_event_embeddings(db, [event_id])
+    exact = n_rows <= EXACT_SCAN_MAX_ROWS
+
+    cols = [
+        Embedding.id.label("embedding_id"),
+        Embedding.image_id,
+        _group_id(),
+        Image.path.label("image_path"),
+        Embedding.x, Embedding.y, Embedding.w, Embedding.h,
+        Embedding.timestamp,
+    ]
+    cand_q = (
+        select(*cols, *([Embedding.vector] if exact else []))
+        .join(Image, Embedding.image_id == Image.id)
+        # on the partition key: the scan is pruned to one partition
+        .where(and_(Embedding.event_id == event_id, Embedding.vector.isnot(None)))
+    )
+    if min_quality is not None:
+        cand_q = cand_q.where(Embedding.quality >= min_quality)
+    if exact:
+        # materialized so the planner scans the event's rows, not the index
+        cand = cand_q.cte("candidates").prefix_with("MATERIALIZED")
+        emb_id, group_id = cand.c.embedding_id, cand.c.group_id
+        dist = cand.c.vector.cosine_distance(vector).label("distance")
+        base_q = select(*[c for c in cand.c if c.name != "vector"], dist)
+    else:
+        emb_id, group_id = Embedding.id, func.coalesce(Image.duplicate_of, Image.id)
+        dist = Embedding.vector.cosine_distance(vector).label("distance")
+        base_q = cand_q.add_columns(dist)
+    base_q = base_q.order_by(dist, emb_id)
+
+    if cursor is not None:
+        after = tuple_(literal(cursor[0]), literal(cursor[1]))
+        # an image (or burst) whose best face was on an earlier page is not
+        # repeated
+        sib, sib_image = aliased(Embedding), aliased(Image)
+        earlier = select(sib.id).join(sib_image, sib.image_id == sib_image.id).where(
+            sib.event_id == event_id,
+            func.coalesce(sib_image.duplicate_of, sib_image.id) == group_id,
+            sib.vector.isnot(None),
+            tuple_(sib.vector.cosine_distance(vector), sib.id) <= after,
+        )
+        if min_quality is not None:
+            earlier = earlier.where(sib.quality >= min_quality)
+        base_q = base_q.where(and_(tuple_(dist, emb_id) > after, ~earlier.exists()))
+
+    # one extra image tells whether there is a next page
+    want = limit + 1
+    fetch = want * 4
+    probes = ANN_PROBES
+    while True:
+        if not exact:
+            await db.execute(text(f"SET LOCAL ivfflat.probes = {int(probes)}"))
+        res = await db.execute(base_q.limit(fetch))
+        rows = res.mappings().all()
+
+        out: List[Dict[str, Any]] = []
+        seen = set()
+        for r in rows:
+            if r["distance"] > threshold or len(out) == want:
+                break
+            if r["group_id"] in seen:
+                continue
+            seen.add(r["group_id"])
+            out.append(_match_dict(r, threshold))
+
+        if len(out) == want:
+            break
+        step = _next_ann_round(rows, fetch, probes, threshold, exact)
+        if step is None:
+            break
+        fetch, probes = step
+
+    if len(out) < want:
+        return out, None
+    out = out[:limit]
+    return out, (out[-1]["distance"], out[-1]["embedding_id"])
+
+
+def centroid(vectors: List[List[float]]) -> List[float]:
+    """
+    Mean direction of several embeddings of one person (each L2-normalized
+    first, so no reference dominates).
+    """
+    arr = np.asarray(vectors, dtype=np.float32)
+    arr /= np.linalg.norm(arr, axis=1, keepdims=True)
+    mean = arr.mean(axis=0)
+    return (mean / np.linalg.norm(mean)).tolist()
 
-    # 2) build a select that computes distance + row_number per image
-    dist = Embedding.vector.cosine_distance(vec).label("distance")
-    row_num = func.row_number().over(
-        partition_by=Embedding.image_id,
-        order_by=dist
-    ).label("row_num")
 
-    base_q = (
+async def find_similar_union(
+    db: AsyncSession,
+    vectors: List[List[float]],
+    event_id: int,
+    limit: int = 10,
+    metric: str = "cosine",
+    min_quality: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Union of the per-reference top-K for several references of one person:
+    each image (or burst of near-duplicates) appears once, with its closest face to any reference. All
+    references are searched by one query, a LATERAL index-ordered top-K per
+    reference.
+    """
+    threshold = find_threshold("ArcFace", metric)
+    refs = values(
+        column("ref", Integer), column("vector", Vector(512)), name="refs"
+    ).data([(i, list(v)) for i, v in enumerate(vectors)])
+
+    # VALUES rows are sent untyped: without the cast the vector arrives as text
+    dist = Embedding.vector.cosine_distance(cast(refs.c.vector, Vector(512))).label("distance")
+    per_ref_q = (
         select(
             Embedding.id.label("embedding_id"),
             Embedding.image_id,
+            _group_id(),
             Image.path.label("image_path"),
             Embedding.x, Embedding.y, Embedding.w, Embedding.h,
+            Embedding.timestamp,
             dist,
-            row_num,
         )
         .join(Image, Embedding.image_id == Image.id)
-        # only candidates under threshold
-        .where(and_(dist <= threshold, Image.event_id == event_id))
+        # on the partition key: the scan is pruned to one partition
+        .where(and_(Embedding.event_id == event_id, Embedding.vector.isnot(None)))
+        .order_by(dist)
+        # headroom for images found by several references
+        .limit(limit * 4)
     )
+    if min_quality is not None:
+        per_ref_q = per_ref_q.where(Embedding.quality >= min_quality)
+    per_ref = per_ref_q.lateral("per_ref")
 
-    # 3) wrap it in a subquery, filter row_num == 1, sort by distance, limit
-    subq = base_q.subquery()
+    hits = (
+        select(
+            per_ref,
+            func.row_number().over(
+                partition_by=per_ref.c.group_id,
+                order_by=(per_ref.c.distance, per_ref.c.embedding_id),
+            ).label("row_num"),
+        )
+        .select_from(refs)
+        .join(per_ref, true())
+        .where(per_ref.c.distance <= threshold)
+        .subquery()
+    )
     final_q = (
-        select(subq)
-        .where(subq.c.row_num == 1)    # best per image
-        .order_by(subq.c.distance)     # now global order
+        select(hits)
+        .where(hits.c.row_num == 1)
+        .order_by(hits.c.distance, hits.c.embedding_id)
         .limit(limit)
     )
+    await db.execute(text(f"SET LOCAL ivfflat.probes = {int(ANN_PROBES)}"))
+    res = await db.execute(final_q)
+    return [_match_dict(r, threshold) for r in res.mappings().all()]
+
+
+async def find_similar_across_events(
+    db: AsyncSession,
+    vector: List[float],
+    event_ids: Optional[List[int]] = None,
+    limit_per_event: int = 10,
+    metric: str = "cosine",
+    min_quality: Optional[float] = None,
+) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    One search over several events (every event when `event_ids` is None),
+    returning up to `limit_per_event` images per event, best first.
+
+    A selective event filter is served by an exact scan of only those
+    events' rows, so the filter never throws away a global top-K and
+    leaves too few results. Broad searches walk the ivfflat index in
+    distance order with a growing LIMIT instead.
+    """
+    threshold = find_threshold("ArcFace", metric)
+    if event_ids is not None:
+        if not event_ids:
+            return {}
+        n_rows = await count_event_embeddings(db, event_ids)
+        if n_rows <= EXACT_SCAN_MAX_ROWS:
+            return await _exact_search_events(
+                db, vector, event_ids, limit_per_event, threshold, min_quality)
+    return await _ann_search_events(
+        db, vector, event_ids, limit_per_event, threshold, min_quality)
+
+
+async def _exact_search_events(
+    db: AsyncSession,
+    vector: List[float],
+    event_ids: List[int],
+    limit_per_event: int,
+    threshold: float,
+    min_quality: Optional[float],
+) -> Dict[int, List[Dict[str, Any]]]:
+    # 1) materialize the rows of the selected events, so the planner
+    #    scans them directly instead of the global index
+    cand_q = (
+        select(
+            Embedding.id.label("embedding_id"),
+            Embedding.image_id,
+            Embedding.event_id,
+            _group_id(),
+            Image.path.label("image_path"),
+            Embedding.x, Embedding.y, Embedding.w, Embedding.h,
+            Embedding.timestamp,
+            Embedding.vector,
+        )
+        .join(Image, Embedding.image_id == Image.id)
+        .where(and_(Embedding.event_id.in_(event_ids), Embedding.vector.isnot(None)))
+    )
+    if min_quality is not None:
+        cand_q = cand_q.where(Embedding.quality >= min_quality)
+    cand = cand_q.cte("candidates").prefix_with("MATERIALIZED")
+
+    # 2) best face per image (or burst) under the threshold
+    dist = cand.c.vector.cosine_distance(vector).label("distance")
+    per_image = (
+        select(
+            cand.c.embedding_id, cand.c.image_id, cand.c.event_id,
+            cand.c.image_path, cand.c.x, cand.c.y, cand.c.w, cand.c.h,
+            cand.c.timestamp,
+            dist,
+            func.row_number().over(
+                partition_by=cand.c.group_id, order_by=dist
+            ).label("row_num"),
+        )
+        .where(dist <= threshold)
+        .subquery()
+    )
+
+    # 3) best images per event
+    ranked = (
+        select(
+            per_image,
+            func.row_number().over(
+                partition_by=per_image.c.event_id,
+                order_by=per_image.c.distance,
+            ).label("event_rank"),
+        )
+        .where(per_image.c.row_num == 1)
+        .subquery()
+    )
+    final_q = (
+        select(ranked)
+        .where(ranked.c.event_rank <= limit_per_event)
+        .order_by(ranked.c.event_id, ranked.c.distance)
+    )
 
     res = await db.execute(final_q)
-    rows = res.mappings().all()  # each row is a dict
-
-    # 4) return the plain dicts under your MatchResult schema
-    out = []
-    for r in rows:
-        out.append({
-            "embedding_id": r["embedding_id"],
-            "image_id":     r["image_id"],
-            "image_path":   r["image_path"],
-            "distance":     r["distance"],
-            "threshold":    threshold,
-            "bbox": {
-                "x": r["x"], "y": r["y"],
-                "w": r["w"], "h": r["h"],
-            },
-        })
+    out: Dict[int, List[Dict[str, Any]]] = {}
+    for r in res.mappings().all():
+        out.setdefault(r["event_id"], []).append(_match_dict(r, threshold))
     return out
+
+
+async def _ann_search_events(
+    db: AsyncSession,
+    vector: List[float],
+    event_ids: Optional[List[int]],
+    limit_per_event: int,
+    threshold: float,
+    min_quality: Optional[float],
+) -> Dict[int, List[Dict[str, Any]]]:
+    dist = Embedding.vector.cosine_distance(vector).label("distance")
+    base_q = (
+        select(
+            Embedding.id.label("embedding_id"),
+            Embedding.image_id,
+            Embedding.event_id,
+            _group_id(),
+            Image.path.label("image_path"),
+            Embedding.x, Embedding.y, Embedding.w, Embedding.h,
+            Embedding.timestamp,
+            dist,
+        )
+        .join(Image, Embedding.image_id == Image.id)
+        .where(Embedding.vector.isnot(None))
+        .order_by(dist)
+    )
+    if event_ids is not None:
+        base_q = base_q.where(Embedding.event_id.in_(event_ids))
+    if min_quality is not None:
+        base_q = base_q.where(Embedding.quality >= min_quality)
+
+    fetch = limit_per_event * 4 * (len(event_ids) if event_ids else 10)
+    probes = ANN_PROBES
+    while True:
+        # index-ordered scan; grow LIMIT and probes until no event is short
+        await db.execute(text(f"SET LOCAL ivfflat.probes = {int(probes)}"))
+        res = await db.execute(base_q.limit(fetch))
+        rows = res.mappings().all()
+
+        out: Dict[int, List[Dict[str, Any]]] = {}
+        seen = set()
+        for r in rows:
+            if r["distance"] > threshold:
+                break
+            if r["group_id"] in seen:
+                continue
+            seen.add(r["group_id"])
+            hits = out.setdefault(r["event_id"], [])
+            if len(hits) < limit_per_event:
+                hits.append(_match_dict(r, threshold))
+
+        full = event_ids is not None and all(
+            len(out.get(e, [])) >= limit_per_event for e in event_ids
+        )
+        # a selective event filter makes short ivfflat reads common: they
+        # only end the search once every list was probed
+        step = None if full else _next_ann_round(rows, fetch, probes, threshold)
+        if step is None:
+            return out
+        fetch, probes = step
+
+
+async def create_subscription(
+    db: AsyncSession,
+    user_id: str,
+    event_id: int,
+    vector: List[float],
+    metric: str = "cosine",
+) -> Subscription:
+    """
+    Registers a reference face for an event and backfills its matches
+    against the faces already in the event with one INSERT ... SELECT.
+    """
+    sub = Subscription(user_id=user_id, event_id=event_id, vector=vector)
+    db.add(sub)
+    await db.flush()
+
+    threshold = find_threshold("ArcFace", metric)
+    dist = Embedding.vector.cosine_distance(vector)
+    backfill = (
+        select(
+            literal(sub.id, Integer),
+            Embedding.id,
+            Embedding.event_id,
+            Embedding.image_id,
+            dist,
+        )
+        .where(and_(Embedding.event_id == event_id, dist <= threshold))
+    )
+    await db.execute(
+        pg_insert(SubscriptionMatch)
+        .from_select(
+            ["subscription_id", "embedding_id", "event_id", "image_id", "distance"],
+            backfill,
+        )
+        .on_conflict_do_nothing()
+    )
+    await db.commit()
+    await db.refresh(sub)
+    return sub
+
+
+async def get_subscriptions(
+    db: AsyncSession, user_id: str, event_id: Optional[int] = None
+) -> List[Subscription]:
+    stmt = select(Subscription).where(Subscription.user_id == user_id)
+    if event_id is not None:
+        stmt = stmt.where(Subscription.event_id == event_id)
+    q = await db.execute(stmt.order_by(Subscription.created_at))
+    return q.scalars().all()
+
+
+async def count_subscription_matches(
+    db: AsyncSession, subscription_id: int
+) -> int:
+    q = await db.execute(
+        select(func.count(func.distinct(SubscriptionMatch.image_id)))
+        .where(SubscriptionMatch.subscription_id == subscription_id)
+    )
+    return q.scalar_one()
+
+
+async def delete_subscription(
+    db: AsyncSession, subscription_id: int, user_id: str
+) -> bool:
+    q = await db.execute(
+        select(Subscription).where(and_(
+            Subscription.id == subscription_id, Subscription.user_id == user_id
+        ))
+    )
+    sub = q.scalars().first()
+    if not sub:
+        return False
+    await db.delete(sub)
+    await db.commit()
+    return True
+
+
+async def match_subscriptions(
+    db: AsyncSession,
+    event_id: int,
+    embeddings: List[Embedding],
+    metric: str = "cosine",
+) -> int:
+    """
+    Compares freshly ingested faces of one image against every active
+    subscription of the event in a single vectorized pass and records the
+    hits. Returns the number of new matches.
+    """
+    embeddings = [e for e in embeddings if e.vector is not None]
+    if not embeddings:
+        return 0
+    q = await db.execute(
+        select(Subscription.id, Subscription.vector)
+        .where(and_(Subscription.event_id == event_id, Subscription.active.is_(True)))
+    )
+    subs = q.all()
+    if not subs:
+        return 0
+
+    threshold = find_threshold("ArcFace", metric)
+    dists = distance_matrix(
+        [s.vector for s in subs], [e.vector for e in embeddings], metric)
+    rows = [
+        {
+            "subscription_id": subs[i].id,
+            "embedding_id":    embeddings[j].id,
+            "event_id":        event_id,
+            "image_id":        embeddings[j].image_id,
+            "distance":        float(dists[i, j]),
+        }
+        for i, j in zip(*np.nonzero(dists <= threshold))
+    ]
+    if not rows:
+        return 0
+    await db.execute(
+        pg_insert(SubscriptionMatch).values(rows).on_conflict_do_nothing()
+    )
+    await db.commit()
+    return len(rows)
+
+
+async def list_my_matches(
+    db: AsyncSession,
+    user_id: str,
+    event_id: int,
+    metric: str = "cosine",
+) -> List[Dict[str, Any]]:
+    """
+    "My photos": the best recorded match per image over the user's active
+    subscriptions in an event. An indexed lookup, no vector search.
+    """
+    threshold = find_threshold("ArcFace", metric)
+    row_num = func.row_number().over(
+        partition_by=SubscriptionMatch.image_id,
+        order_by=SubscriptionMatch.distance,
+    ).label("row_num")
+    subq = (
+        select(
+            Embedding.id.label("embedding_id"),
+            Embedding.image_id,
+            Image.path.label("image_path"),
+            Embedding.x, Embedding.y, Embedding.w, Embedding.h,
+            Embedding.timestamp,
+            SubscriptionMatch.distance.label("distance"),
+            row_num,
+        )
+        .join(Subscription, SubscriptionMatch.subscription_id == Subscription.id)
+        .join(Embedding, and_(
+            SubscriptionMatch.embedding_id == Embedding.id,
+            SubscriptionMatch.event_id == Embedding.event_id,
+        ))
+        .join(Image, SubscriptionMatch.image_id == Image.id)
+        .where(
+            Subscription.user_id == user_id,
+            Subscription.event_id == event_id,
+            Subscription.active.is_(True),
+        )
+        .subquery()
+    )
+    res = await db.execute(
+        select(subq).where(subq.c.row_num == 1).order_by(subq.c.distance)
+    )
+    return [_match_dict(r, threshold) for r in res.mappings().all()]
@@ -6,9 +6,13 @@ DATABASE_URL = os.getenv(
     "DATABASE_URL",
     ""
 )
+# per process: a sharded deployment opens up to
+# len(SHARDS) * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
 
 engine = create_async_engine(
-    DATABASE_URL, echo=False, pool_size=10, max_overflow=20
+    DATABASE_URL, echo=False, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW
 )
 AsyncSessionLocal = sessionmaker(
     bind=engine, class_=AsyncSession, expire_on_commit=False
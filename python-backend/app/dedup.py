@@ -0,0 +1,116 @@
+import io
+import os
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image as PILImage, ImageOps
+
+from .face_quality import MIN_FACE_SIZE
+
+# Burst shots: a photo whose dHash is within PHASH_MAX_DISTANCE bits (of 64)
+# of a recent photo of the same event reuses that photo's faces, as long as
+# the fast detector finds the faces in the same places.
+DEDUP_BURSTS = os.getenv("DEDUP_BURSTS", "1") == "1"
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "6"))
+# only this many of the event's latest photos are compared: bursts are
+# uploaded together
+DEDUP_WINDOW = int(os.getenv("DEDUP_WINDOW", "200"))
+# every stored face must overlap a fast-detector box at least this much
+DEDUP_MIN_IOU = float(os.getenv("DEDUP_MIN_IOU", "0.5"))
+
+_stats: Counter = Counter()
+_stats_lock = threading.Lock()
+
+
+def dhash(data: bytes) -> Optional[int]:
+    """
+    64-bit difference hash of an encoded image (EXIF orientation applied),
+    as a signed value for a BIGINT column. None if it cannot be decoded.
+    """
+    try:
+        img = PILImage.open(io.BytesIO(data))
+        # JPEGs are decoded at reduced scale, the hash only needs 9x8
+        img.draft("L", (64, 64))
+        img = ImageOps.exif_transpose(img).convert("L").resize((9, 8), PILImage.BOX)
+    except Exception:
+        return None
+    px = np.asarray(img, dtype=np.int16)
+    bits = (px[:, 1:] > px[:, :-1]).flatten()
+    value = int("".join("1" if b else "0" for b in bits), 2)
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin((a ^ b) & ((1 << 64) - 1)).count("1")
+
+
+def nearest(phash: int, candidates: Sequence[Tuple[int, int]]) -> Optional[int]:
+    """
+    Id of the closest (image id, hash) candidate within PHASH_MAX_DISTANCE,
+    the latest one on ties.
+    """
+    best: Optional[Tuple[int, int]] = None
+    for image_id, other in candidates:
+        d = hamming(phash, other)
+        if d <= PHASH_MAX_DISTANCE and (best is None or (d, -image_id) < best):
+            best = (d, -image_id)
+    return -best[1] if best else None
+
+
+def _iou(a: Dict[str, float], b: Any) -> float:
+    x1, y1 = max(a["x"], b.x), max(a["y"], b.y)
+    x2 = min(a["x"] + a["w"], b.x + b.w)
+    y2 = min(a["y"] + a["h"], b.y + b.h)
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = a["w"] * a["h"] + b.w * b.h - inter
+    return inter / union if union > 0 else 0.0
+
+
+def boxes_agree(boxes: List[Dict[str, float]], faces: List[Any]) -> bool:
+    """
+    Sanity check before reusing a representative's faces: each stored face
+    overlaps a distinct fast-detector box by at least DEDUP_MIN_IOU. Faces
+    below the quality gate may not be stored, so extra boxes are allowed
+    when they are smaller than MIN_FACE_SIZE; a larger one is a new face.
+    """
+    left = list(boxes)
+    for face in faces:
+        best = max(left, key=lambda b: _iou(b, face), default=None)
+        if best is None or _iou(best, face) < DEDUP_MIN_IOU:
+            return False
+        left.remove(best)
+    return all(min(b["w"], b["h"]) < MIN_FACE_SIZE for b in left)
+
+
+def reused_faces(faces: List[Any]) -> List[Dict[str, Any]]:
+    """
+    Stored embeddings of the representative, in get_embeddings' format.
+    """
+    return [
+        {
+            "embedding": f.vector,
+            "facial_area": {"x": f.x, "y": f.y, "w": f.w, "h": f.h},
+            "quality": f.quality,
+        }
+        for f in faces
+    ]
+
+
+def record(*keys: str) -> None:
+    with _stats_lock:
+        _stats.update(keys)
+
+
+def dedup_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        counts = dict(_stats)
+    checked = counts.get("checked", 0)
+    return {
+        "enabled": DEDUP_BURSTS,
+        "max_distance": PHASH_MAX_DISTANCE,
+        "counts": counts,
+        # share of photos whose inference was skipped
+        "reuse_rate": counts.get("reused", 0) / checked if checked else 0.0,
+    }
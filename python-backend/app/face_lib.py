@@ -1,13 +1,45 @@
+import io
+import os
+import threading
 import cv2
 import pandas as pd
-from typing import Union, Tuple, List, Any, Dict, Optional
+from collections import Counter
+from typing import Union, Tuple, List, Any, Dict, Optional, BinaryIO
 import numpy as np
+from PIL import Image as PILImage
 
 from deepface import DeepFace
 from deepface.commons.logger import Logger
+from deepface.modules import preprocessing
+
+from app.face_quality import score_face, MIN_QUALITY, LOW_QUALITY_MODE
+from app.vector_ops import distance_matrix, match_embedding_matrix
 
 logger = Logger()
 
+# Detector used by get_embeddings. Set FACE_DETECTOR=cascade to run a fast
+# detector first and only fall back to RetinaFace when it is unsure.
+DEFAULT_DETECTOR = os.getenv("FACE_DETECTOR", "retinaface")
+CASCADE_FAST_DETECTOR = os.getenv("CASCADE_FAST_DETECTOR", "yunet")
+CASCADE_FALLBACK_DETECTOR = os.getenv("CASCADE_FALLBACK_DETECTOR", "retinaface")
+# the fast stage is trusted only if every face scores at least this much
+CASCADE_MIN_CONFIDENCE = float(os.getenv("CASCADE_MIN_CONFIDENCE", "0.9"))
+# this many faces (or more) marks the image as a crowded group shot, where
+# light detectors tend to miss the small faces in the back rows
+CASCADE_CROWD_FACES = int(os.getenv("CASCADE_CROWD_FACES", "6"))
+
+# "deepface" runs the Keras models; "onnx" runs RetinaFace and ArcFace
+# exported to ONNX under ONNX Runtime (see app/onnx_backend.py)
+FACE_BACKEND = os.getenv("FACE_BACKEND", "deepface")
+
+_cascade_stats: Counter = Counter()
+_cascade_lock = threading.Lock()
+
+# A path, encoded image bytes / buffer / file object, or a decoded BGR array.
+ImageInput = Union[str, bytes, bytearray, memoryview, BinaryIO, np.ndarray]
+
+_EXIF_ORIENTATION = 0x0112
+
 
 def match_faces(
     source_img: Union[str, np.ndarray],
@@ -71,34 +103,31 @@ def match_faces(
     threshold = DeepFace.verification.find_threshold(
         model_name, distance_metric)
 
-    # 4) For each source face, compute distance & flag match
-    records = []
-    for obj in source_objs:
-        src_face = obj["face"]
-        box = obj["facial_area"]
-        src_embedding = DeepFace.representation.represent(
-            img_path=src_face,
+    # 4) Embed every source face, then compute all distances at once
+    boxes = [obj["facial_area"] for obj in source_objs]
+    src_embeddings = [
+        DeepFace.representation.represent(
+            img_path=obj["face"],
             model_name=model_name,
             enforce_detection=False,   # already cropped
             detector_backend="skip",
             align=False,
             normalization=normalization,
         )[0]["embedding"]
+        for obj in source_objs
+    ]
+    dists = distance_matrix(
+        [target_embedding], src_embeddings, distance_metric)[0]
 
-        dist = DeepFace.verification.find_distance(
-            src_embedding, target_embedding, distance_metric
-        )
-        records.append({
-            "source_x": box["x"],
-            "source_y": box["y"],
-            "source_w": box["w"],
-            "source_h": box["h"],
-            "distance": dist,
-            "threshold": threshold,
-            "match": dist <= threshold,
-        })
-
-    df = pd.DataFrame(records).sort_values("distance").reset_index(drop=True)
+    df = pd.DataFrame({
+        "source_x": [box["x"] for box in boxes],
+        "source_y": [box["y"] for box in boxes],
+        "source_w": [box["w"] for box in boxes],
+        "source_h": [box["h"] for box in boxes],
+        "distance": dists,
+        "threshold": threshold,
+        "match": dists <= threshold,
+    }).sort_values("distance").reset_index(drop=True)
     match_found = df["match"].any()
     return df, match_found
 
@@ -140,45 +169,373 @@ def draw_matches(
     return img
 
 
-def get_embeddings(
+def _apply_exif_orientation(img: np.ndarray, data: Any) -> np.ndarray:
+    try:
+        orientation = PILImage.open(io.BytesIO(data)).getexif().get(_EXIF_ORIENTATION, 1)
+    except Exception:
+        return img
+    if orientation == 2:
+        return cv2.flip(img, 1)
+    if orientation == 3:
+        return cv2.rotate(img, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(img, 0)
+    if orientation == 5:
+        return cv2.transpose(img)
+    if orientation == 6:
+        return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.flip(cv2.transpose(img), -1)
+    if orientation == 8:
+        return cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return img
+
+
+def decode_image(data: Union[bytes, bytearray, memoryview]) -> np.ndarray:
+    """
+    Decodes an encoded image straight from memory into a BGR array, with
+    its EXIF orientation applied.
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    img = cv2.imdecode(buf, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+    if img is None:
+        raise ValueError("Could not decode image")
+    return _apply_exif_orientation(img, data)
+
+
+def load_image(img: ImageInput) -> np.ndarray:
+    """
+    BGR array for any ImageInput. Arrays are returned as they are, so the
+    result can be handed to every later stage without decoding again.
+    """
+    if isinstance(img, np.ndarray):
+        return img
+    if isinstance(img, str):
+        with open(img, "rb") as f:
+            return decode_image(f.read())
+    if hasattr(img, "read"):
+        return decode_image(img.read())
+    return decode_image(img)
+
+
+def _found_faces(face_objs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Drops the placeholder DeepFace returns when nothing was detected
+    (the whole image with confidence 0) under enforce_detection=False.
+    """
+    return [obj for obj in face_objs if (obj.get("confidence") or 0) > 0]
+
+
+def _record_cascade(*keys: str) -> None:
+    with _cascade_lock:
+        _cascade_stats.update(keys)
+
+
+def cascade_stats() -> Dict[str, Any]:
+    """
+    Per-stage counters of the detector cascade, plus the derived hit rates
+    used to tune CASCADE_MIN_CONFIDENCE and CASCADE_CROWD_FACES.
+    """
+    with _cascade_lock:
+        counts = dict(_cascade_stats)
+    images = counts.get("images", 0)
+    escalated = counts.get("escalated", 0)
+    return {
+        "fast_detector": CASCADE_FAST_DETECTOR,
+        "fallback_detector": CASCADE_FALLBACK_DETECTOR,
+        "counts": counts,
+        # share of images fully handled by the fast detector
+        "fast_hit_rate": counts.get("fast_accepted", 0) / images if images else 0.0,
+        # share of escalated images where the fallback found at least one face
+        "fallback_hit_rate": counts.get("fallback_found", 0) / escalated if escalated else 0.0,
+    }
+
+
+def detect_faces_cascade(
     img: Union[str, np.ndarray],
+    enforce_detection: bool = False,
+    align: bool = True,
+    expand_percentage: int = 0,
+    crowded: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Runs CASCADE_FAST_DETECTOR and only escalates to the fallback detector
+    (RetinaFace) when no face is found, any face scores below
+    CASCADE_MIN_CONFIDENCE, or the image is a crowded group shot, either
+    flagged by the caller or because the fast stage found many faces.
+    """
+    _record_cascade("images")
+    fast_objs: List[Dict[str, Any]] = []
+    if not crowded:
+        try:
+            fast_objs = _found_faces(DeepFace.detection.extract_faces(
+                img_path=img,
+                detector_backend=CASCADE_FAST_DETECTOR,
+                enforce_detection=False,
+                align=align,
+                expand_percentage=expand_percentage,
+                anti_spoofing=True
+            ))
+        except Exception as e:
+            logger.info(f"Fast detector {CASCADE_FAST_DETECTOR} failed: {e}")
+
+    if crowded or len(fast_objs) >= CASCADE_CROWD_FACES:
+        reason = "escalated_crowded"
+    elif not fast_objs:
+        reason = "escalated_no_face"
+    elif min(obj["confidence"] for obj in fast_objs) < CASCADE_MIN_CONFIDENCE:
+        reason = "escalated_low_confidence"
+    else:
+        _record_cascade("fast_accepted")
+        return fast_objs
+
+    face_objs = DeepFace.detection.extract_faces(
+        img_path=img,
+        detector_backend=CASCADE_FALLBACK_DETECTOR,
+        enforce_detection=enforce_detection,
+        align=align,
+        expand_percentage=expand_percentage,
+        anti_spoofing=True
+    )
+    _record_cascade("escalated", reason)
+    if _found_faces(face_objs):
+        _record_cascade("fallback_found")
+    return face_objs
+
+
+_backend_lock = threading.Lock()
+_backend_ready = False
+
+
+def _init_backend() -> None:
+    # with the ONNX backend, DeepFace's "retinaface" detector is swapped for
+    # the ONNX session before anything builds the Keras one
+    global _backend_ready
+    if FACE_BACKEND != "onnx" or _backend_ready:
+        return
+    with _backend_lock:
+        if not _backend_ready:
+            from app import onnx_backend
+            onnx_backend.install_retinaface()
+            _backend_ready = True
+
+
+def warm_up(model_name: str = "ArcFace") -> None:
+    """
+    Loads the recognition model and the detectors get_embeddings will use,
+    so the first request does not pay for it.
+    """
+    _init_backend()
+    if FACE_BACKEND == "onnx":
+        from app import onnx_backend
+        onnx_backend.session("arcface")
+    else:
+        DeepFace.build_model(model_name=model_name, task="facial_recognition")
+    detectors = [DEFAULT_DETECTOR]
+    if DEFAULT_DETECTOR == "cascade":
+        detectors = [CASCADE_FAST_DETECTOR, CASCADE_FALLBACK_DETECTOR]
+    for detector in detectors:
+        DeepFace.build_model(model_name=detector, task="face_detector")
+
+
+def get_embeddings(
+    img: ImageInput,
     model_name: str = "ArcFace",
-    detector_backend: str = "retinaface",
+    detector_backend: str = DEFAULT_DETECTOR,
     enforce_detection: bool = False,
     align: bool = True,
     expand_percentage: int = 0,
     normalization: str = "base",
+    crowded: bool = False,
+    min_quality: float = MIN_QUALITY,
+    keep_low_quality: bool = LOW_QUALITY_MODE == "keep",
 ) -> List[Dict[str, Any]]:
     """
     Detects all faces in `img` and returns their embeddings.
+
+    With detector_backend="cascade" detection goes through
+    detect_faces_cascade; `crowded` flags a group shot so the cascade
+    goes straight to the accurate detector.
+
+    Every face gets a "quality" score (see face_quality.score_face). Faces
+    below `min_quality` are not embedded: they are dropped, or returned
+    with embedding=None when `keep_low_quality` is set.
+
+    `img` may be a path, raw encoded bytes or a buffer; it is decoded once
+    and the same array is used by every detector and the quality stage.
     """
+    img = load_image(img)
     # 1) detect and crop faces
-    face_objs = DeepFace.detection.extract_faces(
-        img_path=img,
+    face_objs = detect_faces(
+        img,
         detector_backend=detector_backend,
         enforce_detection=enforce_detection,
         align=align,
         expand_percentage=expand_percentage,
-        anti_spoofing=True
+        crowded=crowded,
     )
     embeddings: List[Dict[str, Any]] = []
-    # 2) embed each face
+    pending: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+    # 2) score every face; those below the quality gate are not embedded
     for obj in face_objs:
-        face = obj["face"]
-        rep = DeepFace.representation.represent(
-            img_path=face,
-            model_name=model_name,
-            enforce_detection=False,
-            detector_backend="skip",
-            normalization=model_name,
-            anti_spoofing=True
-            
-        )
-        rep[0]["facial_area"] = obj["facial_area"]
-        embeddings.append(rep[0])
+        quality = score_face(obj)
+        if quality < min_quality:
+            if keep_low_quality:
+                embeddings.append(_face_result(obj, quality))
+            continue
+        face = _face_result(obj, quality)
+        embeddings.append(face)
+        pending.append((face, obj))
+
+    # 3) embed the kept faces in one forward pass
+    vectors = represent_faces([obj["face"] for _, obj in pending], model_name)
+    for (face, _), vector in zip(pending, vectors):
+        face["embedding"] = vector
     return embeddings
 
 
+def detect_faces(
+    img: Union[str, np.ndarray],
+    detector_backend: str = DEFAULT_DETECTOR,
+    enforce_detection: bool = False,
+    align: bool = True,
+    expand_percentage: int = 0,
+    crowded: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Detects and crops faces, through the cascade when
+    detector_backend="cascade".
+    """
+    _init_backend()
+    if detector_backend == "cascade":
+        return detect_faces_cascade(
+            img,
+            enforce_detection=enforce_detection,
+            align=align,
+            expand_percentage=expand_percentage,
+            crowded=crowded,
+        )
+    return DeepFace.detection.extract_faces(
+        img_path=img,
+        detector_backend=detector_backend,
+        enforce_detection=enforce_detection,
+        align=align,
+        expand_percentage=expand_percentage,
+        anti_spoofing=True
+    )
+
+
+def detect_boxes(
+    img: ImageInput, detector_backend: str = CASCADE_FAST_DETECTOR
+) -> List[Dict[str, int]]:
+    """
+    Face boxes only, from the fast detector without alignment: the cheap
+    check that a burst frame still has its faces where the representative
+    had them.
+    """
+    _init_backend()
+    face_objs = _found_faces(DeepFace.detection.extract_faces(
+        img_path=load_image(img),
+        detector_backend=detector_backend,
+        enforce_detection=False,
+        align=False,
+    ))
+    return [
+        {k: obj["facial_area"][k] for k in ("x", "y", "w", "h")}
+        for obj in face_objs
+    ]
+
+
+def _face_result(obj: Dict[str, Any], quality: float) -> Dict[str, Any]:
+    # embedding stays None for faces below the quality gate
+    return {
+        "embedding": None,
+        "facial_area": obj["facial_area"],
+        "face_confidence": obj.get("confidence"),
+        "quality": quality,
+    }
+
+
+def preprocess_faces(
+    faces: List[np.ndarray],
+    input_shape: Tuple[int, int],
+    normalization: str = "ArcFace",
+) -> np.ndarray:
+    """
+    Batch of face crops as the recognition model expects it. Mirrors
+    DeepFace.representation.represent with detector_backend="skip", so
+    both backends see exactly the same input.
+    """
+    batch = []
+    for face in faces:
+        img = face[:, :, ::-1]
+        img = preprocessing.resize_image(
+            img=img, target_size=(input_shape[1], input_shape[0]))
+        batch.append(preprocessing.normalize_input(img=img, normalization=normalization))
+    return np.concatenate(batch, axis=0)
+
+
+def represent_faces(
+    faces: List[np.ndarray],
+    model_name: str = "ArcFace",
+) -> List[List[float]]:
+    """
+    Embeds already detected face crops with a single forward pass of the
+    recognition model, on the configured FACE_BACKEND. Preprocessing uses
+    normalization=model_name, like get_embeddings always has.
+    """
+    if not faces:
+        return []
+    if FACE_BACKEND == "onnx":
+        from app import onnx_backend
+        batch = preprocess_faces(faces, onnx_backend.arcface_input_size(), model_name)
+        return onnx_backend.embed(batch).tolist()
+    model = DeepFace.build_model(model_name=model_name, task="facial_recognition")
+    batch = preprocess_faces(faces, model.input_shape, model_name)
+    out = model.model(batch, training=False)
+    return np.asarray(out).tolist()
+
+
+def get_embeddings_batch(
+    imgs: List[ImageInput],
+    model_name: str = "ArcFace",
+    detector_backend: str = DEFAULT_DETECTOR,
+    min_quality: float = MIN_QUALITY,
+    keep_low_quality: bool = LOW_QUALITY_MODE == "keep",
+) -> List[Union[List[Dict[str, Any]], ValueError]]:
+    """
+    get_embeddings for several images at once: decoding and detection run
+    per image, then every face that passes the quality gate is embedded in
+    one batch. Returns one list of faces per input image, in input order;
+    an image that cannot be decoded or detected gets its ValueError in its
+    slot instead of failing the batch.
+    """
+    results: List[Union[List[Dict[str, Any]], ValueError]] = []
+    pending: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+    for img in imgs:
+        try:
+            face_objs = detect_faces(load_image(img), detector_backend=detector_backend)
+        except ValueError as e:
+            results.append(e)
+            continue
+        faces: List[Dict[str, Any]] = []
+        for obj in face_objs:
+            quality = score_face(obj)
+            if quality < min_quality:
+                if keep_low_quality:
+                    faces.append(_face_result(obj, quality))
+                continue
+            face = _face_result(obj, quality)
+            faces.append(face)
+            pending.append((face, obj))
+        results.append(faces)
+
+    vectors = represent_faces([obj["face"] for _, obj in pending], model_name)
+    for (face, _), vector in zip(pending, vectors):
+        face["embedding"] = vector
+    return results
+
+
 def match_embeddings(
     target_embedding: Dict[str, Any],
     embeddings: List[Dict[str, Any]],
@@ -186,25 +543,27 @@ def match_embeddings(
     distance_metric: str = "cosine",
 ) -> Optional[List[Dict[str, Any]]]:
     """
-    Returns True if `target_embedding` matches any embedding in `embeddings`
-    under the threshold for the given model and metric.
+    Returns the embeddings in `embeddings` that match `target_embedding`
+    under the threshold for the given model and metric, closest first,
+    or None if nothing matches.
     """
-    threshold = DeepFace.verification.find_threshold(
-        model_name, distance_metric)
-    valid_match = []
-    distances = []
-    for emb in embeddings:
-        if emb is None:
-            continue
-        dist = DeepFace.verification.find_distance(
-            emb["embedding"], target_embedding["embedding"], distance_metric
-        )
-        if dist <= threshold:
-            distances.append(dist)
-            valid_match.append(emb)
+    candidates = [
+        emb for emb in embeddings
+        if emb is not None and emb.get("embedding") is not None
+    ]
+    if not candidates:
+        return None
+    idx, _ = match_embedding_matrix(
+        [target_embedding["embedding"]],
+        [emb["embedding"] for emb in candidates],
+        model_name=model_name,
+        distance_metric=distance_metric,
+        top_k=len(candidates),
+    )
+    valid_match = [candidates[i] for i in idx[0] if i >= 0]
     if len(valid_match) == 0:
         return None
-    return [emb for _, emb in sorted(zip(distances, valid_match))]
+    return valid_match
 
 
 if __name__ == "__main__":
@@ -0,0 +1,78 @@
+import os
+from typing import Any, Dict, Optional
+
+import cv2
+import numpy as np
+
+# Faces whose shorter bbox side is below this (in pixels) are never embedded.
+MIN_FACE_SIZE = int(os.getenv("QUALITY_MIN_FACE_SIZE", "40"))
+# Laplacian variance at which a face counts as fully sharp.
+BLUR_REFERENCE = float(os.getenv("QUALITY_BLUR_REFERENCE", "100"))
+# Faces scoring below this are skipped (or stored without a vector).
+MIN_QUALITY = float(os.getenv("FACE_QUALITY_MIN", "0.25"))
+# "skip" drops low quality faces, "keep" stores their bbox without a vector.
+LOW_QUALITY_MODE = os.getenv("FACE_QUALITY_MODE", "skip")
+
+# blur is measured on a fixed size crop so scores are comparable across faces
+_BLUR_SIZE = (112, 112)
+
+
+def size_score(facial_area: Dict[str, Any]) -> float:
+    """
+    0 below MIN_FACE_SIZE, then grows linearly up to 1 at twice that size.
+    """
+    side = min(facial_area["w"], facial_area["h"])
+    if side < MIN_FACE_SIZE:
+        return 0.0
+    return float(min(1.0, side / (2 * MIN_FACE_SIZE)))
+
+
+def blur_score(face: np.ndarray) -> float:
+    """
+    Variance of the Laplacian of the face crop, scaled by BLUR_REFERENCE.
+    `face` is the crop returned by DeepFace (RGB floats in [0, 1]) or a
+    uint8 image.
+    """
+    if face is None or face.size == 0:
+        return 0.0
+    if face.dtype != np.uint8:
+        face = np.clip(face * 255, 0, 255).astype(np.uint8)
+    if face.ndim == 3:
+        face = cv2.cvtColor(face, cv2.COLOR_RGB2GRAY)
+    face = cv2.resize(face, _BLUR_SIZE, interpolation=cv2.INTER_AREA)
+    variance = cv2.Laplacian(face, cv2.CV_64F).var()
+    return float(min(1.0, variance / BLUR_REFERENCE))
+
+
+def pose_score(facial_area: Dict[str, Any]) -> float:
+    """
+    Rough frontal-ness from the eye landmarks: the eyes of a frontal face
+    are well apart and centred in the box, a profile brings them together
+    and pushes them to one side. 0.5 when the detector gives no eyes.
+    """
+    left: Optional[tuple] = facial_area.get("left_eye")
+    right: Optional[tuple] = facial_area.get("right_eye")
+    w = facial_area["w"]
+    if not left or not right or not w:
+        return 0.5
+    eye_dist = abs(left[0] - right[0]) / w
+    eye_mid = (left[0] + right[0]) / 2
+    offset = abs(eye_mid - (facial_area["x"] + w / 2)) / (w / 2)
+    # frontal faces have an inter-eye distance around 0.35-0.45 of the width
+    spread = min(1.0, eye_dist / 0.35)
+    return float(max(0.0, spread * (1.0 - min(1.0, offset))))
+
+
+def score_face(face_obj: Dict[str, Any]) -> float:
+    """
+    Quality score in [0, 1] of one face returned by extract_faces:
+    the product of size, blur, pose and detector confidence.
+    """
+    area = face_obj["facial_area"]
+    confidence = float(min(1.0, max(0.0, face_obj.get("confidence") or 0.0)))
+    score = size_score(area)
+    if score == 0 or confidence == 0:
+        return 0.0
+    score *= blur_score(face_obj.get("face"))
+    score *= pose_score(area)
+    return round(score * confidence, 4)
@@ -0,0 +1,70 @@
+import hashlib
+import os
+import time
+from typing import Any, Dict, List, Union
+
+import numpy as np
+
+# Stand-in for face_lib when INFERENCE_BACKEND=fake: no models, no image
+# decoding, the same input always yields the same faces. Faces are drawn
+# from a fixed pool of identities so matches behave like real traffic
+# (several photos per person, most queries find something).
+FAKE_IDENTITIES = int(os.getenv("FAKE_IDENTITIES", "200"))
+FAKE_MAX_FACES = int(os.getenv("FAKE_MAX_FACES", "4"))
+# simulated model time per image, to keep the API's concurrency realistic
+FAKE_EMBED_MS = float(os.getenv("FAKE_EMBED_MS", "0"))
+FAKE_NOISE = 0.25
+DIM = 512
+
+_identities: Dict[int, np.ndarray] = {}
+
+
+def _identity(i: int) -> np.ndarray:
+    if i not in _identities:
+        v = np.random.default_rng(i).standard_normal(DIM)
+        _identities[i] = v / np.linalg.norm(v)
+    return _identities[i]
+
+
+def _digest(img: Union[str, bytes, np.ndarray]) -> bytes:
+    if isinstance(img, np.ndarray):
+        data = img.tobytes()
+    elif isinstance(img, str):
+        with open(img, "rb") as f:
+            data = f.read()
+    else:
+        data = img
+    return hashlib.sha1(data).digest()
+
+
+def get_embeddings(img: Union[str, bytes, np.ndarray], **kwargs: Any) -> List[Dict[str, Any]]:
+    """
+    Same output shape as face_lib.get_embeddings, derived from a hash of
+    the input.
+    """
+    if FAKE_EMBED_MS:
+        time.sleep(FAKE_EMBED_MS / 1000.0)
+    rng = np.random.default_rng(int.from_bytes(_digest(img)[:8], "little"))
+    faces = []
+    for k in range(int(rng.integers(0, FAKE_MAX_FACES + 1))):
+        v = _identity(int(rng.integers(FAKE_IDENTITIES))) + \
+            FAKE_NOISE * rng.standard_normal(DIM) / np.sqrt(DIM)
+        faces.append({
+            "embedding": (v / np.linalg.norm(v)).tolist(),
+            "facial_area": {"x": 40 + 120 * k, "y": 60, "w": 96, "h": 96},
+            "face_confidence": 0.99,
+            "quality": round(float(rng.uniform(0.3, 1.0)), 3),
+        })
+    return faces
+
+
+def get_embeddings_batch(imgs: List[Union[str, bytes, np.ndarray]], **kwargs: Any) -> List[List[Dict[str, Any]]]:
+    return [get_embeddings(img, **kwargs) for img in imgs]
+
+
+def detect_boxes(img: Union[str, bytes, np.ndarray], **kwargs: Any) -> List[Dict[str, Any]]:
+    return [face["facial_area"] for face in get_embeddings(img)]
+
+
+def cascade_stats() -> Dict[str, Any]:
+    return {"backend": "fake"}
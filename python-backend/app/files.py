@@ -0,0 +1,88 @@
+import os
+import time
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Image
+
+IMAGE_DIR = os.getenv("IMAGE_DIR", "data")
+# files younger than this are never collected: an upload writes its file
+# before the images row exists
+GC_GRACE_SECONDS = int(os.getenv("GC_GRACE_SECONDS", "3600"))
+GC_BATCH_SIZE = 500
+
+
+def image_file(path: str) -> str:
+    """
+    On-disk location of an `Image.path` (stored as a bare filename).
+    """
+    return os.path.join(IMAGE_DIR, path)
+
+
+def remove_files(paths: Iterable[str]) -> int:
+    """
+    Removes the files of the given `Image.path`s, ignoring missing ones.
+    Blocking: call it from a thread or a background task.
+    """
+    removed = 0
+    for path in paths:
+        try:
+            os.remove(image_file(path))
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def _old_files(directory: str, grace_seconds: int) -> Iterator[os.DirEntry]:
+    if not os.path.isdir(directory):
+        return
+    cutoff = time.time() - grace_seconds
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.is_file(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                yield entry
+
+
+async def _chunks(it: Iterator[Any], size: int):
+    # pull the directory listing in slices so scandir never blocks the loop
+    while True:
+        chunk = await run_in_threadpool(lambda: list(islice(it, size)))
+        if not chunk:
+            return
+        yield chunk
+
+
+async def gc_orphan_files(
+    db: AsyncSession,
+    grace_seconds: int = GC_GRACE_SECONDS,
+    batch_size: int = GC_BATCH_SIZE,
+    dry_run: bool = False,
+) -> Dict[str, Any]:
+    """
+    Reconciles IMAGE_DIR against the images table and removes files that no
+    row references. The directory is streamed in batches and each batch is
+    checked with one IN query, so memory stays flat for any number of files.
+    """
+    scanned = orphans = removed = 0
+    async for chunk in _chunks(_old_files(IMAGE_DIR, grace_seconds), batch_size):
+        scanned += len(chunk)
+        names = [entry.name for entry in chunk]
+        q = await db.execute(select(Image.path).where(Image.path.in_(names)))
+        known = set(q.scalars().all())
+        missing = [name for name in names if name not in known]
+        orphans += len(missing)
+        if not dry_run:
+            removed += await run_in_threadpool(remove_files, missing)
+
+    return {
+        "scanned": scanned,
+        "orphans": orphans,
+        "removed": removed,
+        "dry_run": dry_run,
+    }
+
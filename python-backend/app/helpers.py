@@ -1,3 +1,4 @@
+import hmac
 import requests
 import os
 from typing import Optional, Dict
@@ -6,6 +7,10 @@ from fastapi import FastAPI, HTTPException, Depends, Header
 from app.schemas import EventOut
 from app.models import Event
 
+# Shared secret of operator endpoints (file GC, shard ring), sent as the
+# X-Admin-Token header. Unset disables them.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
 # Token validation function
 
 
@@ -71,3 +76,14 @@ async def get_current_user(authorization: Optional[str] = Header(None)) -> Dict:
         )
 
     return user_data
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """
+    FastAPI dependency for operator endpoints: X-Admin-Token must match
+    ADMIN_TOKEN. End-user tokens never grant access.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
@@ -0,0 +1,204 @@
+import asyncio
+import os
+from typing import Any, Dict, List, Union
+
+import requests
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from .batching import MicroBatcher
+from .scheduler import Lane, inference_scheduler
+
+# "fake" replaces the face models with app.fake_embedder, in process
+# (load testing, see loadtest/).
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "deepface")
+# Base URL of the inference worker (app.worker). When empty the models are
+# loaded lazily inside the API process instead, on first use.
+INFERENCE_URL = "" if INFERENCE_BACKEND == "fake" \
+    else os.getenv("INFERENCE_URL", "").rstrip("/")
+INFERENCE_TIMEOUT = float(os.getenv("INFERENCE_TIMEOUT", "120"))
+
+_session = requests.Session()
+
+
+def _post(route: str, **kwargs: Any) -> Dict[str, Any]:
+    try:
+        response = _session.post(
+            f"{INFERENCE_URL}{route}", timeout=INFERENCE_TIMEOUT, **kwargs
+        )
+    except requests.RequestException as e:
+        print(f"Inference worker unreachable: {e}")
+        raise HTTPException(503, detail="Inference service unavailable")
+    if response.status_code == 400:
+        raise HTTPException(400, detail=response.json().get("detail", "Bad image"))
+    if response.status_code != 200:
+        raise HTTPException(502, detail=f"Inference service error: {response.text}")
+    return response.json()
+
+
+def _get(route: str) -> Dict[str, Any]:
+    try:
+        response = _session.get(f"{INFERENCE_URL}{route}", timeout=INFERENCE_TIMEOUT)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        print(f"Inference worker unreachable: {e}")
+        raise HTTPException(503, detail="Inference service unavailable")
+    return response.json()
+
+
+def _face_lib():
+    # TensorFlow and the face models are only imported when inference
+    # actually runs in this process
+    if INFERENCE_BACKEND == "fake":
+        from app import fake_embedder
+        return fake_embedder
+    from app import face_lib
+    return face_lib
+
+
+async def get_embeddings(
+    img: Union[str, bytes], lane: Lane = "bulk", **kwargs: Any
+) -> List[Dict[str, Any]]:
+    """
+    face_lib.get_embeddings, run by the inference worker when INFERENCE_URL
+    is set, or by this process's scheduler otherwise, in the given priority
+    lane. `img` is either the encoded image bytes, sent as is, or a path
+    readable by the worker.
+    """
+    if INFERENCE_URL:
+        if isinstance(img, str):
+            data = await run_in_threadpool(
+                _post, "/embed", json={"path": os.path.abspath(img), **kwargs},
+                headers={"X-Priority": lane},
+            )
+        else:
+            data = await run_in_threadpool(
+                _post, "/embed/bytes", data=img, params=kwargs,
+                headers={"Content-Type": "application/octet-stream", "X-Priority": lane},
+            )
+        return data["faces"]
+    return await inference_scheduler.run(lane, _local_embeddings, img, kwargs)
+
+
+def _local_embeddings(img: Union[str, bytes], kwargs: Dict[str, Any]) -> List[Dict[str, Any]]:
+    try:
+        return _face_lib().get_embeddings(img, **kwargs)
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+
+
+def _local_boxes(img: bytes) -> List[Dict[str, Any]]:
+    try:
+        return _face_lib().detect_boxes(img)
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+
+
+async def detect_boxes(img: bytes, lane: Lane = "bulk") -> List[Dict[str, Any]]:
+    """
+    face_lib.detect_boxes on encoded image bytes: fast-detector face boxes,
+    no embeddings.
+    """
+    if INFERENCE_URL:
+        data = await run_in_threadpool(
+            _post, "/detect/bytes", data=img,
+            headers={"Content-Type": "application/octet-stream", "X-Priority": lane},
+        )
+        return data["boxes"]
+    return await inference_scheduler.run(lane, _local_boxes, img)
+
+
+async def get_embeddings_batch(
+    images: List[bytes], lane: Lane = "interactive"
+) -> List[Union[List[Dict[str, Any]], HTTPException]]:
+    """
+    face_lib.get_embeddings_batch on in-memory images: one list of faces per
+    image, with all faces embedded in a single forward pass. An image that
+    cannot be processed gets an HTTPException (400) in its slot instead, so
+    it does not fail the other images of the batch.
+    """
+    if INFERENCE_URL:
+        data = await run_in_threadpool(
+            _post, "/embed/batch",
+            files=[("files", (f"image{i}", image)) for i, image in enumerate(images)],
+            headers={"X-Priority": lane},
+        )
+        return [
+            HTTPException(400, detail=r["error"]) if "error" in r else r["faces"]
+            for r in data["results"]
+        ]
+    return await inference_scheduler.run(lane, _local_embeddings_batch, images)
+
+
+def _local_embeddings_batch(
+    images: List[bytes],
+) -> List[Union[List[Dict[str, Any]], HTTPException]]:
+    try:
+        results = _face_lib().get_embeddings_batch(images)
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+    return [
+        HTTPException(400, detail=str(r)) if isinstance(r, Exception) else r
+        for r in results
+    ]
+
+
+# concurrent /match queries are embedded together
+query_batcher = MicroBatcher(get_embeddings_batch)
+
+
+async def embed_query(image: bytes) -> List[Dict[str, Any]]:
+    """
+    Embeds an uploaded query image (never written to disk) through the
+    micro-batcher. Raises batching.QueueFull when too many queries are
+    already waiting.
+    """
+    return await query_batcher.submit(image)
+
+
+async def embed_queries(images: List[bytes]) -> List[List[Dict[str, Any]]]:
+    """
+    Several query images submitted together, so the micro-batcher embeds
+    them in the same forward pass.
+    """
+    return list(await asyncio.gather(*(query_batcher.submit(image) for image in images)))
+
+
+def _video():
+    from app import video
+    return video
+
+
+async def get_video_embeddings(path: str, lane: Lane = "bulk") -> List[Dict[str, Any]]:
+    """
+    video.get_video_embeddings through the worker (or in-process): a few
+    representative faces per tracked person, each with a "timestamp".
+    Between sampled frames the job yields its slot to waiting searches.
+    """
+    if INFERENCE_URL:
+        data = await run_in_threadpool(
+            _post, "/embed_video", json={"path": os.path.abspath(path)},
+            headers={"X-Priority": lane},
+        )
+        return data["faces"]
+    if INFERENCE_BACKEND == "fake":
+        return await inference_scheduler.run(lane, _local_embeddings, path, {})
+    try:
+        return await inference_scheduler.run(
+            lane, _video().get_video_embeddings, path,
+            between_frames=lambda: inference_scheduler.checkpoint(lane),
+        )
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+
+
+async def detector_stats() -> Dict[str, Any]:
+    if INFERENCE_URL:
+        return await run_in_threadpool(_get, "/stats/detector")
+    return _face_lib().cascade_stats()
+
+
+async def scheduler_stats() -> Dict[str, Any]:
+    if INFERENCE_URL:
+        return await run_in_threadpool(_get, "/stats/scheduler")
+    return inference_scheduler.stats()
@@ -0,0 +1,57 @@
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .db import AsyncSessionLocal
+
+# In-process registry of background jobs, polled through GET /jobs/{job_id}.
+_jobs: Dict[str, Dict[str, Any]] = {}
+_MAX_FINISHED_JOBS = 1000
+
+
+def create_job(kind: str) -> Dict[str, Any]:
+    job = {
+        "id": uuid.uuid4().hex,
+        "kind": kind,
+        "status": "pending",
+        "created_at": datetime.now(timezone.utc),
+        "finished_at": None,
+        "result": {},
+        "error": None,
+    }
+    _jobs[job["id"]] = job
+    _prune()
+    return job
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    return _jobs.get(job_id)
+
+
+def _prune() -> None:
+    finished = [j for j in _jobs.values() if j["finished_at"] is not None]
+    for job in sorted(finished, key=lambda j: j["finished_at"])[:-_MAX_FINISHED_JOBS]:
+        _jobs.pop(job["id"], None)
+
+
+async def run_job(
+    job: Dict[str, Any],
+    fn: Callable[..., Awaitable[Dict[str, Any]]],
+    *args: Any,
+    **kwargs: Any,
+) -> None:
+    """
+    Runs `fn(db, *args, **kwargs)` with its own session (the request's
+    session is closed by the time background tasks run) and records the
+    outcome on the job.
+    """
+    job["status"] = "running"
+    try:
+        async with AsyncSessionLocal() as db:
+            job["result"] = await fn(db, *args, **kwargs)
+        job["status"] = "done"
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = datetime.now(timezone.utc)
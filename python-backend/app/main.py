@@ -1,39 +1,79 @@
+import json
+import logging
 import os
 import time
 import shutil
-from typing import Any, List, Dict
+from typing import Any, List, Dict, Literal, Optional
 from dotenv import load_dotenv
 
 load_dotenv(dotenv_path=".env.local", override=True)
 
 from app.models import Embedding
-from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, status, Response
+from fastapi import (
+    FastAPI, UploadFile, File, Depends, HTTPException, status, Response, Query, BackgroundTasks
+)
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.middleware.cors import CORSMiddleware
-from app.helpers import get_current_user
+from app.helpers import get_current_user, require_admin
 from uuid import UUID
 from datetime import datetime
-from .db import engine, Base
+from .db import engine, Base, AsyncSessionLocal
 from .crud import (
     get_embedding_by_id,
     get_or_create_image,
+    recent_image_hashes,
+    set_image_hash,
     add_embedding,
     list_embeddings,
+    list_embeddings_for_images,
     find_similar,
+    find_similar_across_events,
+    find_similar_union,
+    centroid,
+    encode_cursor,
+    decode_cursor,
     get_image,
     delete_image_from_db,
     get_all_images,
     create_event,
     get_event,
+    get_event_version,
+    bump_event_version,
     get_all_events,
     update_event,
     delete_event,
+    delete_events_bulk,
+    delete_images_bulk,
+    create_subscription,
+    get_subscriptions,
+    count_subscription_matches,
+    delete_subscription,
+    match_subscriptions,
+    list_my_matches,
+)
+from .schemas import (
+    EmbeddingOut, ImageOut, MatchResult, EventIn, EventOut, EventMatches, SubscriptionOut,
+    BulkDeleteIn, JobOut, SpriteIndexOut, RingIn,
 )
-from .schemas import EmbeddingOut, ImageOut, MatchResult, EventIn, EventOut
 from .deps import get_db
-from app.face_lib import get_embeddings  # <— our helper
+from .cache import match_cache
+from .files import IMAGE_DIR, remove_files, gc_orphan_files
+from .jobs import create_job, get_job, run_job
+from .sprites import get_sprite_index, gc_sprites, remove_event_sprites
+from .archive import export_event, import_event
+from . import dedup, sharding
+from .inference import (
+    get_embeddings, get_video_embeddings, detect_boxes, embed_query, embed_queries,
+    query_batcher,
+    detector_stats as inference_detector_stats,
+    scheduler_stats as inference_scheduler_stats,
+)
+from .batching import QueueFull
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="FindMyPix API")
 
@@ -50,10 +90,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],         
     allow_headers=["*"],        
+    expose_headers=["X-Next-Cursor"],
 )
 
+MATCH_MAX_LIMIT = 100
+MATCH_MAX_REFERENCES = 5
+# images whose sibling faces are fetched per query of a streamed response
+STREAM_SIBLING_CHUNK = 8
+StreamFormat = Literal["ndjson", "sse"]
+
 
-IMAGE_DIR = os.getenv("IMAGE_DIR", "data")
 app.mount(
     "/files",
     StaticFiles(directory=IMAGE_DIR),
@@ -61,6 +107,15 @@ app.mount(
 )
 
 
+@app.exception_handler(QueueFull)
+async def queue_full_handler(request, exc: QueueFull):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many searches in progress, try again shortly"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 @app.on_event("startup")
 async def on_startup():
     # create tables if they don't exist
@@ -173,17 +228,170 @@ async def api_update_event(
 )
 async def api_delete_event(
     event_id: int,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user),
 ):
-    ok = await delete_event(db, event_id=event_id, user_id=current_user["id"])
-    print("Ok is", ok)
-    print(event_id)
-    if not ok:
+    paths = await delete_event(db, event_id=event_id, user_id=current_user["id"])
+    if paths is None:
         raise HTTPException(404, "Event not found")
+    # files go after the response, off the event loop
+    background_tasks.add_task(remove_files, paths)
+    background_tasks.add_task(remove_event_sprites, [event_id])
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
+@app.get("/events/{event_id}/export")
+async def api_export_event(
+    event_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    The event's faces (bboxes, vectors, quality) and image metadata as an
+    .npz archive, importable elsewhere without re-running inference.
+    """
+    ev = await get_event(db, event_id)
+    if not ev:
+        raise HTTPException(404, "Event not found")
+    if str(ev.user_id) != current_user["id"]:
+        raise HTTPException(403, "Only the event owner can export it")
+    data = await export_event(db, event_id)
+    return Response(
+        content=data,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="event_{event_id}.npz"'},
+    )
+
+
+@app.post("/events/import", response_model=EventOut, status_code=201)
+async def api_import_event(
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Creates a new event owned by the caller from an export archive. Fails
+    with 409 if any image path already exists.
+    """
+    ev = await import_event(db, await file.read(), user_id=current_user["id"])
+    return EventOut(
+        title=ev.title,
+        id=ev.id,
+        date=ev.date,
+        description=ev.description,
+        is_owner=True,
+    )
+
+
+BULK_DELETE_BATCH = 500
+BULK_DELETE_EVENT_BATCH = 20
+
+
+async def bulk_delete_events_job(db: AsyncSession, event_ids: List[int], user_id: str):
+    deleted = files = 0
+    for start in range(0, len(event_ids), BULK_DELETE_EVENT_BATCH):
+        batch = event_ids[start:start + BULK_DELETE_EVENT_BATCH]
+        ids, paths = await delete_events_bulk(db, batch, user_id)
+        deleted += len(ids)
+        files += await run_in_threadpool(remove_files, paths)
+        await run_in_threadpool(remove_event_sprites, ids)
+    return {"requested": len(event_ids), "deleted": deleted, "files_removed": files}
+
+
+async def bulk_delete_images_job(db: AsyncSession, image_ids: List[int], user_id: str):
+    deleted = files = 0
+    events = set()
+    for start in range(0, len(image_ids), BULK_DELETE_BATCH):
+        batch = image_ids[start:start + BULK_DELETE_BATCH]
+        ev_ids, paths = await delete_images_bulk(db, batch, user_id)
+        events.update(ev_ids)
+        deleted += len(paths)
+        files += await run_in_threadpool(remove_files, paths)
+    for ev_id in events:
+        await bump_event_version(db, ev_id)
+    return {"requested": len(image_ids), "deleted": deleted, "files_removed": files}
+
+
+@app.post("/events/bulk-delete", response_model=JobOut, status_code=202)
+async def api_bulk_delete_events(
+    payload: BulkDeleteIn,
+    background_tasks: BackgroundTasks,
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Deletes the caller's events in `ids` as a background job; poll
+    GET /jobs/{id} for the outcome.
+    """
+    job = create_job("delete_events")
+    background_tasks.add_task(
+        run_job, job, bulk_delete_events_job, list(dict.fromkeys(payload.ids)), current_user["id"])
+    return job
+
+
+@app.post("/images/bulk-delete", response_model=JobOut, status_code=202)
+async def api_bulk_delete_images(
+    payload: BulkDeleteIn,
+    background_tasks: BackgroundTasks,
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Deletes images (in events owned by the caller) as a background job.
+    """
+    job = create_job("delete_images")
+    background_tasks.add_task(
+        run_job, job, bulk_delete_images_job, list(dict.fromkeys(payload.ids)), current_user["id"])
+    return job
+
+
+@app.post("/admin/gc", response_model=JobOut, status_code=202)
+async def api_gc_files(
+    background_tasks: BackgroundTasks,
+    dry_run: bool = False,
+    _admin: None = Depends(require_admin),
+):
+    """
+    Removes files in IMAGE_DIR that no image row references, and derived
+    sprite sheets of deleted events or outdated event versions. Operators
+    only (X-Admin-Token).
+    """
+    job = create_job("gc_files")
+    background_tasks.add_task(run_job, job, gc_files_job, dry_run=dry_run)
+    return job
+
+
+async def gc_files_job(db: AsyncSession, dry_run: bool = False):
+    result = await gc_orphan_files(db, dry_run=dry_run)
+    result["sprites"] = await gc_sprites(db, dry_run=dry_run)
+    return result
+
+
+@app.put("/admin/ring")
+async def api_set_ring(
+    payload: RingIn,
+    _admin: None = Depends(require_admin),
+):
+    """
+    Installs the shard ring pushed by the router when shards are added or
+    removed (X-Admin-Token). Cached results of events that moved to another
+    shard are dropped to make room for the ones this shard now serves.
+    """
+    ring = sharding.set_ring(payload.shards)
+    dropped = match_cache.evict(lambda key: not sharding.owns(key[1]))
+    return {"shards": ring.shards, "self": sharding.SHARD_URL, "dropped_cache_entries": dropped}
+
+
+@app.get("/jobs/{job_id}", response_model=JobOut)
+async def api_get_job(
+    job_id: str,
+    current_user: dict = Depends(get_current_user),
+):
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(404, "Job not found")
+    return job
+
+
 @app.delete(
     "/images/{image_id}",
     status_code=status.HTTP_204_NO_CONTENT,
@@ -191,37 +399,45 @@ async def api_delete_event(
 )
 async def delete_image(
     image_id: int,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
     current_user: Dict = Depends(get_current_user),
 ):
     # 1) Look up the image
     image = await get_image(db, image_id)
-    print("Image is ", image)
     if not image:
         raise HTTPException(status_code=404, detail="Image not found")
 
-    # 2) (Optional) remove the file from disk
-    try:
-        os.remove(image.path)
-    except FileNotFoundError:
-        pass
-
-    # 3) Delete the Image row.
+    # 2) Delete the Image row (embeddings cascade with it)
+    event_id = image.event_id
     await delete_image_from_db(db, image)
+    await bump_event_version(db, event_id)
 
-    # 4) Verify no embeddings remain
-    remaining = await list_embeddings(db, image_id)
-    if remaining and len(remaining) > 0:
-        # Something went wrong with your cascade
-        raise HTTPException(
-            status_code=500,
-            detail=f"Delete failed: {remaining} embeddings still exist"
-        )
+    # 3) remove the file from disk once the response is sent
+    background_tasks.add_task(remove_files, [image.path])
 
-    # 5) 204 No Content has no body
+    # 4) 204 No Content has no body
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
+@app.get("/events/{event_id}/faces/sprites", response_model=SpriteIndexOut)
+async def api_face_sprites(
+    event_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: Dict = Depends(get_current_user),
+):
+    """
+    Every searchable face of the event as small crops packed into a few
+    sprite sheets (fetch them at /files/{sheet}), with the position of each
+    emb_id, so a face picker needs a handful of requests instead of one
+    full-size image per photo.
+    """
+    index = await get_sprite_index(db, event_id)
+    if index is None:
+        raise HTTPException(404, "Event not found")
+    return index
+
+
 @app.get("/images/{event_id}", response_model=List[ImageOut])
 async def list_images(event_id: int, db: AsyncSession = Depends(get_db), current_user: Dict = Depends(get_current_user)):
     """
@@ -244,122 +460,467 @@ async def upload_image(
     save_dir = IMAGE_DIR
     os.makedirs(save_dir, exist_ok=True)
     path = os.path.join(save_dir, file.filename)
+    data = await file.read()
     with open(path, "wb") as f:
-        f.write(await file.read())
+        f.write(data)
 
     # 2) Upsert image record
     img = await get_or_create_image(db, file.filename, event_id)
 
-    # 3) Extract embeddings + bboxes via face_lib
-    embeds = await run_in_threadpool(get_embeddings, path)
+    # 3) Burst frames reuse the faces of a near-duplicate photo; anything
+    #    else goes through face_lib, from the bytes in hand
+    phash = await run_in_threadpool(dedup.dhash, data) if dedup.DEDUP_BURSTS else None
+    embeds, duplicate_of = None, None
+    if phash is not None:
+        embeds, duplicate_of = await burst_faces(db, event_id, img.id, data, phash)
+    if embeds is None:
+        embeds = await get_embeddings(data)
+    out = await store_faces(db, event_id, img, embeds)
+    # hashed last, so only photos with their faces stored become
+    # representatives
+    if phash is not None:
+        await set_image_hash(db, img.id, phash, duplicate_of)
+    return out
+
+
+async def burst_faces(db: AsyncSession, event_id: int, image_id: int, data: bytes, phash: int):
+    """
+    The faces of a recent near-duplicate photo of the event and its id, or
+    (None, None) when there is none or the fast detector disagrees with
+    its stored faces.
+    """
+    dedup.record("checked")
+    rep_id = dedup.nearest(
+        phash, await recent_image_hashes(db, event_id, image_id, dedup.DEDUP_WINDOW))
+    if rep_id is None:
+        return None, None
+    dedup.record("near_duplicate")
+    faces = await list_embeddings(db, rep_id)
+    if not dedup.boxes_agree(await detect_boxes(data), faces):
+        dedup.record("bbox_mismatch")
+        return None, None
+    dedup.record("reused")
+    return dedup.reused_faces(faces), rep_id
+
+
+@app.post("/videos/{event_id}", response_model=ImageOut)
+async def upload_video(
+    event_id: int,
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db),
+    current_user: Dict = Depends(get_current_user),
+):
+    """
+    Ingests a video clip: frames are sampled on scene/motion changes and
+    faces are tracked across them, so each person contributes a few
+    embeddings, each carrying its timestamp in the clip.
+    """
+    # 1) Save upload to local disk
+    os.makedirs(IMAGE_DIR, exist_ok=True)
+    path = os.path.join(IMAGE_DIR, file.filename)
+    with open(path, "wb") as f:
+        while chunk := await file.read(1024 * 1024):
+            f.write(chunk)
+
+    # 2) Upsert the media record and extract representative faces
+    img = await get_or_create_image(db, file.filename, event_id, media_type="video")
+    embeds = await get_video_embeddings(path)
+    return await store_faces(db, event_id, img, embeds)
+
+
+async def store_faces(db: AsyncSession, event_id: int, img, embeds: List[Dict[str, Any]]) -> ImageOut:
     if not embeds:
         return ImageOut(
-        id=img.id,
-        path=img.path,
-        embeddings=[],
+            id=img.id,
+            path=img.path,
+            media_type=img.media_type,
+            embeddings=[],
         )
     # 4) Persist each embedding
     for emb in embeds:
         bbox = emb["facial_area"]
         vector = emb["embedding"]
-        await add_embedding(db, img.id, bbox, vector)
+        await add_embedding(
+            db, event_id, img.id, bbox, vector,
+            quality=emb.get("quality"), timestamp=emb.get("timestamp"),
+        )
 
-    # 5) Fetch all embeddings back and return
+    # 5) Fetch all embeddings back, feed standing subscriptions, and return
     embs = await list_embeddings(db, img.id)
-    embs_data = [
-        {
-            "id":         e.id,
-            "image_id":   e.image_id,
-            "x":          e.x,
-            "y":          e.y,
-            "w":          e.w,
-            "h":          e.h,
-        }
-        for e in embs
-    ]
+    await match_subscriptions(db, event_id, embs)
+    await bump_event_version(db, event_id)
     return ImageOut(
         id=img.id,
         path=img.path,
-        embeddings=embs_data,
+        media_type=img.media_type,
+        embeddings=[embedding_data(e) for e in embs],
     )
 
 
+def embedding_data(e: Embedding) -> dict[str, Any]:
+    return {
+        "id":         e.id,
+        "image_id":   e.image_id,
+        "x":          e.x,
+        "y":          e.y,
+        "w":          e.w,
+        "h":          e.h,
+        "quality":    e.quality,
+        "timestamp":  e.timestamp,
+    }
+
+
+@app.post("/match", response_model=List[EventMatches])
+async def match_image_across_events(
+    file: UploadFile = File(...),
+    event_ids: Optional[List[int]] = Query(None),
+    limit: int = Query(10, ge=1, le=MATCH_MAX_LIMIT),
+    min_quality: Optional[float] = None,
+    stream: Optional[StreamFormat] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: Dict = Depends(get_current_user),
+):
+    """
+    Searches several events with one query face, grouped per event.
+    Without `event_ids` every event is searched: like GET /events, all
+    events are visible to any signed-in user. With `stream` the results
+    are streamed (see stream_matches), each match carrying its event_id.
+    """
+    # 1) embed the query once
+    query_embeds = [e for e in await embed_query(await file.read()) if e["embedding"] is not None]
+    if not query_embeds:
+        raise HTTPException(400, detail="No face found in query image")
+    target = query_embeds[0]["embedding"]
+
+    # 2) one filtered search over all requested events
+    grouped = await find_similar_across_events(
+        db, target, event_ids, limit_per_event=limit, min_quality=min_quality
+    )
+    if stream:
+        return stream_matches(list(grouped.items()), None, stream)
+
+    # 3) sibling faces of every hit in a single query
+    image_ids = [r["image_id"] for results in grouped.values() for r in results]
+    siblings = await list_embeddings_for_images(db, image_ids)
+    out = []
+    for ev_id, results in grouped.items():
+        for res in results:
+            res["other_embeddings"] = [embedding_data(e) for e in siblings[res["image_id"]]]
+        out.append(EventMatches(
+            event_id=ev_id, results=[MatchResult(**r) for r in results]))
+    return out
+
+
 @app.post("/match/{event_id}", response_model=List[MatchResult])
 async def match_image(
     event_id: int,
-    file: UploadFile = File(...),
+    response: Response,
+    file: Optional[UploadFile] = File(None),
+    files: Optional[List[UploadFile]] = File(None),
+    fusion: Literal["union", "centroid"] = "union",
+    min_quality: Optional[float] = None,
+    limit: int = Query(10, ge=1, le=MATCH_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    stream: Optional[StreamFormat] = None,
     db: AsyncSession = Depends(get_db),
 ):
-    # 1) save query to temp
-    tmp_dir = "/tmp/findmypix"
-    os.makedirs(tmp_dir, exist_ok=True)
-    tmp_path = os.path.join(tmp_dir, file.filename)
-    with open(tmp_path, "wb") as f:
-        f.write(await file.read())
+    """
+    Images of the event matching the query's face, best first. When more
+    matches exist the X-Next-Cursor header holds the `cursor` of the next
+    page. `stream=ndjson|sse` streams the results instead.
 
-    # 2) extract embeddings from query
-    query_embeds = get_embeddings(tmp_path)
-    if not query_embeds:
+    Several reference photos of the same person (`files`) are searched
+    together: "centroid" searches their mean embedding, "union" merges
+    the best matches of each reference (no paging).
+    """
+    uploads = ([file] if file else []) + (files or [])
+    if not uploads:
+        raise HTTPException(400, detail="No query image")
+    if len(uploads) > MATCH_MAX_REFERENCES:
+        raise HTTPException(400, detail=f"At most {MATCH_MAX_REFERENCES} reference images")
+    after = page_cursor(cursor)
+
+    # 1) embed every reference in one batch, decoded in memory
+    embeds = await embed_queries([await upload.read() for upload in uploads])
+    # for now just take the first face of each reference
+    targets = [
+        faces[0]["embedding"] for faces in
+        ([e for e in found if e["embedding"] is not None] for found in embeds)
+        if faces
+    ]
+    if not targets:
         raise HTTPException(400, detail="No face found in query image")
 
-    # for now just take the first face
-    target = query_embeds[0]["embedding"]
-
     # 3) find nearest neighbors in DB
-    results = await find_similar(db, target, event_id, limit=10, metric="cosine")
+    next_cursor = None
+    if len(targets) > 1 and fusion == "union":
+        if after is not None:
+            raise HTTPException(400, detail="Union of references has no further pages")
+        results = await find_similar_union(
+            db, targets, event_id, limit=limit, metric="cosine", min_quality=min_quality
+        )
+    else:
+        target = targets[0] if len(targets) == 1 else centroid(targets)
+        results, next_cursor = await find_similar(
+            db, target, event_id, limit=limit, metric="cosine",
+            min_quality=min_quality, cursor=after,
+        )
+        set_next_cursor(response, next_cursor)
+    if stream:
+        return stream_matches([(None, results)], next_cursor, stream)
     if not results:
         # empty list => no match under threshold
         return []
 
+    siblings = await list_embeddings_for_images(db, [r["image_id"] for r in results])
     for res in results:
-        embs = await list_embeddings(db, res["image_id"])
-        embs_data: List[dict[str, Any]] = [
-            {
-                "id":         e.id,
-                "image_id":   e.image_id,
-                "x":          e.x,
-                "y":          e.y,
-                "w":          e.w,
-                "h":          e.h,
-            }
-            for e in embs
-        ]
-        res["other_embeddings"] = embs_data
+        res["other_embeddings"] = [embedding_data(e) for e in siblings[res["image_id"]]]
     return [MatchResult(**r) for r in results]
 
 
+def page_cursor(cursor: Optional[str]):
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(400, detail="Invalid cursor")
+
+
+def set_next_cursor(response: Response, next_cursor) -> None:
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = encode_cursor(next_cursor)
+
+
+def stream_matches(
+    groups: List[tuple], next_cursor, fmt: str
+) -> StreamingResponse:
+    """
+    Streams search results as NDJSON lines or Server-Sent Events:
+
+      {"type": "match", ...MatchResult without other_embeddings}
+      {"type": "siblings", "image_id": ..., "embeddings": [...]}
+      {"type": "end", "next_cursor": ...}
+
+    `groups` is a list of (event_id, results); event_id is added to each
+    match record unless None. All matches go out at once, then the sibling
+    faces follow a few images at a time, so the first photos render
+    before their bboxes are loaded.
+    """
+    async def records():
+        pending = []
+        for event_id, results in groups:
+            for r in results:
+                rec = MatchResult(**{"other_embeddings": [], **r}).model_dump(
+                    exclude={"other_embeddings"})
+                if event_id is not None:
+                    rec["event_id"] = event_id
+                yield {"type": "match", **rec}
+                if "other_embeddings" not in r:
+                    pending.append(r["image_id"])
+        for event_id, results in groups:
+            for r in results:
+                if "other_embeddings" in r:
+                    yield {"type": "siblings", "image_id": r["image_id"],
+                           "embeddings": r["other_embeddings"]}
+        pending = list(dict.fromkeys(pending))
+        if pending:
+            # the request's session is closed once streaming starts
+            async with AsyncSessionLocal() as db:
+                for start in range(0, len(pending), STREAM_SIBLING_CHUNK):
+                    chunk = pending[start:start + STREAM_SIBLING_CHUNK]
+                    siblings = await list_embeddings_for_images(db, chunk)
+                    for image_id in chunk:
+                        yield {"type": "siblings", "image_id": image_id,
+                               "embeddings": [embedding_data(e) for e in siblings[image_id]]}
+        yield {"type": "end",
+               "next_cursor": encode_cursor(next_cursor) if next_cursor is not None else None}
+
+    async def encode():
+        try:
+            async for rec in records():
+                data = json.dumps(rec, default=str)
+                yield f"event: {rec['type']}\ndata: {data}\n\n" if fmt == "sse" else data + "\n"
+        except Exception:
+            # the status line is already sent: report the failure in-band
+            logger.exception("Streaming matches failed")
+            data = json.dumps({"type": "error", "detail": "Search failed"})
+            yield f"event: error\ndata: {data}\n\n" if fmt == "sse" else data + "\n"
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = encode_cursor(next_cursor)
+    return StreamingResponse(
+        encode(),
+        media_type="text/event-stream" if fmt == "sse" else "application/x-ndjson",
+        headers=headers,
+    )
+
+
 @app.get("/match/{event_id}/{emb_id}", response_model=List[MatchResult])
 async def match_image_with_id(
     event_id: int,
     emb_id: int,
+    response: Response,
+    min_quality: Optional[float] = None,
+    limit: int = Query(10, ge=1, le=MATCH_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    stream: Optional[StreamFormat] = None,
     db: AsyncSession = Depends(get_db),
     current_user: Dict = Depends(get_current_user),
 ):
+    after = page_cursor(cursor)
+
+    # 1) serve repeated clicks from the cache while the event is unchanged
+    version = await get_event_version(db, event_id)
+    if version is None:
+        raise HTTPException(404, "Event not found")
+    cache_key = ("match", event_id, version, emb_id, min_quality, limit, after)
+    cached = match_cache.get(cache_key)
+    if cached is not None:
+        out, next_cursor = cached
+        if stream:
+            return stream_matches([(None, out)], next_cursor, stream)
+        set_next_cursor(response, next_cursor)
+        return out
 
     # 2) extract embeddings from query
     query_embeds: Embedding = await get_embedding_by_id(db, emb_id)
-    if not query_embeds:
+    if not query_embeds or query_embeds.vector is None:
         raise HTTPException(400, detail="No face found in query image")
     # 3) find nearest neighbors in DB
-    results = await find_similar(db, query_embeds.vector, event_id, limit=10, metric="cosine")
+    results, next_cursor = await find_similar(
+        db, query_embeds.vector, event_id, limit=limit, metric="cosine",
+        min_quality=min_quality, cursor=after,
+    )
+    if stream:
+        # not cached: the cache holds complete responses only
+        return stream_matches([(None, results)], next_cursor, stream)
 
+    siblings = await list_embeddings_for_images(db, [r["image_id"] for r in results])
     for res in results:
-        embs = await list_embeddings(db, res["image_id"])
-        embs_data: List[dict[str, Any]] = [
-            {
-                "id":         e.id,
-                "image_id":   e.image_id,
-                "x":          e.x,
-                "y":          e.y,
-                "w":          e.w,
-                "h":          e.h,
-            }
-            for e in embs
-        ]
-        res["other_embeddings"] = embs_data
+        res["other_embeddings"] = [embedding_data(e) for e in siblings[res["image_id"]]]
+    out = [MatchResult(**r).model_dump() for r in results]
+    match_cache.put(cache_key, (out, next_cursor))
+    set_next_cursor(response, next_cursor)
+    return out
+
+
+@app.post("/subscriptions/{event_id}", response_model=SubscriptionOut, status_code=201)
+async def api_create_subscription(
+    event_id: int,
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db),
+    current_user: Dict = Depends(get_current_user),
+):
+    """
+    Registers the face in `file` as a standing search in the event: photos
+    already uploaded are matched now, new ones as they are ingested.
+    """
+    if not await get_event(db, event_id):
+        raise HTTPException(404, "Event not found")
+    query_embeds = [e for e in await embed_query(await file.read()) if e["embedding"] is not None]
+    if not query_embeds:
+        raise HTTPException(400, detail="No face found in query image")
+
+    sub = await create_subscription(
+        db, current_user["id"], event_id, query_embeds[0]["embedding"])
+    return SubscriptionOut(
+        id=sub.id,
+        event_id=sub.event_id,
+        active=sub.active,
+        created_at=sub.created_at,
+        match_count=await count_subscription_matches(db, sub.id),
+    )
+
+
+@app.get("/subscriptions/{event_id}", response_model=List[SubscriptionOut])
+async def api_list_subscriptions(
+    event_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: Dict = Depends(get_current_user),
+):
+    subs = await get_subscriptions(db, current_user["id"], event_id)
+    return [
+        SubscriptionOut(
+            id=sub.id,
+            event_id=sub.event_id,
+            active=sub.active,
+            created_at=sub.created_at,
+            match_count=await count_subscription_matches(db, sub.id),
+        )
+        for sub in subs
+    ]
+
+
+@app.get("/subscriptions/{event_id}/matches", response_model=List[MatchResult])
+async def api_my_matches(
+    event_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: Dict = Depends(get_current_user),
+):
+    """
+    "My photos": everything the user's subscriptions matched in the event.
+    """
+    results = await list_my_matches(db, current_user["id"], event_id)
+    siblings = await list_embeddings_for_images(db, [r["image_id"] for r in results])
+    for res in results:
+        res["other_embeddings"] = [embedding_data(e) for e in siblings[res["image_id"]]]
     return [MatchResult(**r) for r in results]
 
 
+@app.delete(
+    "/subscriptions/{subscription_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    responses={404: {"description": "Subscription not found"}},
+)
+async def api_delete_subscription(
+    subscription_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: Dict = Depends(get_current_user),
+):
+    ok = await delete_subscription(db, subscription_id, current_user["id"])
+    if not ok:
+        raise HTTPException(404, "Subscription not found")
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@app.get("/stats/cache")
+async def cache_stats():
+    return match_cache.stats()
+
+
+@app.get("/stats/batching")
+async def batching_stats():
+    return query_batcher.stats()
+
+
+@app.get("/stats/dedup")
+async def dedup_stats():
+    """
+    How many uploads were near-duplicates of a recent photo and reused its
+    faces instead of running detection and embedding.
+    """
+    return dedup.dedup_stats()
+
+
+@app.get("/stats/detector")
+async def detector_stats():
+    """
+    Hit rates of the detector cascade (FACE_DETECTOR=cascade).
+    """
+    return await inference_detector_stats()
+
+
+@app.get("/stats/scheduler")
+async def scheduler_stats():
+    """
+    Running and waiting jobs per priority lane, queue-wait percentiles and
+    how often bulk work yielded to searches.
+    """
+    return await inference_scheduler_stats()
+
+
 @ app.get("/health")
 async def health():
     return {"status": "ok"}
@@ -1,15 +1,36 @@
+import os
+
 from sqlalchemy import (
-    UUID, Column, Integer, String, ForeignKey, Float, Index, DateTime
+    DDL, UUID, BigInteger, Column, Integer, String, ForeignKey, ForeignKeyConstraint, Float, Index,
+    DateTime, Boolean, UniqueConstraint, event, func
 )
 from sqlalchemy.orm import relationship
 from pgvector.sqlalchemy import Vector
 from .db import Base
 
+# embeddings is hash-partitioned on event_id; each partition has its own
+# ivfflat index, so a search in one event only touches 1/N of the corpus.
+# Changing either value requires recreating the table.
+EMBEDDING_PARTITIONS = int(os.getenv("EMBEDDING_PARTITIONS", "16"))
+EMBEDDING_IVF_LISTS = int(os.getenv("EMBEDDING_IVF_LISTS", "100"))
+
 
 class Image(Base):
     __tablename__ = "images"
     id = Column(Integer, primary_key=True, index=True)
     path = Column(String, unique=True, nullable=False)
+    # "image" or "video"
+    media_type = Column(String, nullable=False, default="image", server_default="image")
+    # 64-bit dHash of the photo, set once its faces are stored
+    phash = Column(BigInteger, nullable=True)
+    # representative of the burst this photo belongs to; its faces were
+    # copied from that image instead of being detected again
+    duplicate_of = Column(
+        Integer,
+        ForeignKey("images.id", ondelete="SET NULL"),
+        nullable=True,
+        index=True,
+    )
     embeddings = relationship("Embedding",
                               back_populates="image",
                               cascade="all, delete-orphan",
@@ -30,14 +51,25 @@ class Image(Base):
 
 class Embedding(Base):
     __tablename__ = "embeddings"
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    # denormalized from the image: the partition key, so it is part of the
+    # primary key
+    event_id = Column(
+        Integer,
+        ForeignKey("events.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
     image_id = Column(Integer, ForeignKey("images.id"),
                       nullable=False, index=True)
     x = Column(Float, nullable=False)
     y = Column(Float, nullable=False)
     w = Column(Float, nullable=False)
     h = Column(Float, nullable=False)
-    vector = Column(Vector(512), nullable=False)
+    # NULL for faces stored below the quality gate (bbox only)
+    vector = Column(Vector(512), nullable=True)
+    quality = Column(Float, nullable=True, index=True)
+    # seconds into the clip for faces found in a video, NULL for photos
+    timestamp = Column(Float, nullable=True)
 
     image = relationship("Image", back_populates="embeddings")
 
@@ -46,7 +78,21 @@ class Embedding(Base):
             "idx_embeddings_vector_ivf",
             "vector",
             postgresql_using="ivfflat",
-            postgresql_with={"lists": 100},
+            postgresql_with={"lists": EMBEDDING_IVF_LISTS},
+        ),
+        {"postgresql_partition_by": "HASH (event_id)"},
+    )
+
+
+for _remainder in range(EMBEDDING_PARTITIONS):
+    # indexes declared on the parent are created on every partition
+    event.listen(
+        Embedding.__table__,
+        "after_create",
+        DDL(
+            f"CREATE TABLE IF NOT EXISTS embeddings_p{_remainder} "
+            f"PARTITION OF embeddings FOR VALUES WITH "
+            f"(MODULUS {EMBEDDING_PARTITIONS}, REMAINDER {_remainder})"
         ),
     )
 
@@ -58,5 +104,66 @@ class Event(Base):
     title = Column(String, nullable=False)
     date = Column(DateTime(timezone=True), nullable=False)
     description = Column(String)
+    # bumped whenever the event's photos change; keys the match result cache
+    version = Column(Integer, nullable=False, default=0, server_default="0")
     images = relationship("Image", back_populates="event",
                           cascade="all, delete-orphan", lazy="selectin")
+
+
+class Subscription(Base):
+    """
+    A standing "find me" request: a reference face registered by a user
+    for one event, matched against new faces as they are ingested.
+    """
+    __tablename__ = "subscriptions"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(UUID, nullable=False, index=True)
+    event_id = Column(
+        Integer,
+        ForeignKey("events.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    vector = Column(Vector(512), nullable=False)
+    active = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    matches = relationship("SubscriptionMatch",
+                           back_populates="subscription",
+                           cascade="all, delete-orphan",
+                           passive_deletes=True)
+
+    __table_args__ = (
+        Index("idx_subscriptions_event_active", "event_id", "active"),
+    )
+
+
+class SubscriptionMatch(Base):
+    __tablename__ = "subscription_matches"
+    id = Column(Integer, primary_key=True, index=True)
+    subscription_id = Column(
+        Integer,
+        ForeignKey("subscriptions.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    embedding_id = Column(Integer, nullable=False)
+    # completes the reference to the partitioned embeddings key
+    event_id = Column(Integer, nullable=False)
+    image_id = Column(
+        Integer,
+        ForeignKey("images.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    distance = Column(Float, nullable=False)
+
+    subscription = relationship("Subscription", back_populates="matches")
+
+    __table_args__ = (
+        UniqueConstraint("subscription_id", "embedding_id",
+                         name="uq_subscription_matches_sub_emb"),
+        ForeignKeyConstraint(
+            ["embedding_id", "event_id"],
+            ["embeddings.id", "embeddings.event_id"],
+            ondelete="CASCADE",
+        ),
+    )
@@ -0,0 +1,104 @@
+import os
+import threading
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+# ONNX exports of DeepFace's RetinaFace and ArcFace, written by
+# scripts/export_onnx.py as {name}.onnx and {name}.int8.onnx.
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "models")
+# run the int8 (dynamically quantized) variants
+ONNX_INT8 = os.getenv("ONNX_INT8", "0") == "1"
+# intra-op threads per session, 0 lets onnxruntime use every core
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+
+_sessions: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def model_path(name: str, int8: bool = ONNX_INT8) -> str:
+    return os.path.join(ONNX_MODEL_DIR, f"{name}.int8.onnx" if int8 else f"{name}.onnx")
+
+
+def session(name: str):
+    """
+    The ONNX Runtime CPU session of one exported model, created once.
+    """
+    with _lock:
+        if name not in _sessions:
+            import onnxruntime as ort
+
+            path = model_path(name)
+            if not os.path.exists(path):
+                raise FileNotFoundError(
+                    f"{path} not found, export it with scripts/export_onnx.py")
+            opts = ort.SessionOptions()
+            opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if ONNX_THREADS:
+                opts.intra_op_num_threads = ONNX_THREADS
+            _sessions[name] = ort.InferenceSession(
+                path, opts, providers=["CPUExecutionProvider"])
+        return _sessions[name]
+
+
+class _Output:
+    # the retinaface package calls .numpy() on each output of its model
+    def __init__(self, array: np.ndarray):
+        self.array = array
+
+    def numpy(self) -> np.ndarray:
+        return self.array
+
+
+class RetinaFaceSession:
+    """
+    Callable stand-in for the Keras RetinaFace model: same input tensor,
+    same outputs in the same order, so retinaface's anchor decoding, NMS
+    and landmark handling (and DeepFace's alignment on top) are reused as
+    they are.
+    """
+
+    def __init__(self, sess):
+        self.session = sess
+        self.input_name = sess.get_inputs()[0].name
+
+    def __call__(self, im_tensor: Any) -> List[_Output]:
+        outputs = self.session.run(
+            None, {self.input_name: np.asarray(im_tensor, dtype=np.float32)})
+        return [_Output(o) for o in outputs]
+
+
+def install_retinaface() -> None:
+    """
+    Registers a RetinaFace detector backed by the ONNX session in DeepFace's
+    model cache, so extract_faces(detector_backend="retinaface") runs on
+    ONNX Runtime without ever loading the Keras weights.
+    """
+    from deepface.models.face_detection.RetinaFace import RetinaFaceClient
+    from deepface.modules import modeling
+
+    if not hasattr(modeling, "cached_models"):
+        # the cache is created by the first build_model; opencv is cheap
+        # to build and loads no weights
+        modeling.build_model(task="face_detector", model_name="opencv")
+    client = RetinaFaceClient.__new__(RetinaFaceClient)
+    client.model = RetinaFaceSession(session("retinaface"))
+    modeling.cached_models["face_detector"]["retinaface"] = client
+
+
+def arcface_input_size() -> Tuple[int, int]:
+    """
+    Input size of the exported ArcFace, in the order of DeepFace's
+    FacialRecognition.input_shape.
+    """
+    shape = session("arcface").get_inputs()[0].shape
+    h, w = (d if isinstance(d, int) else 112 for d in shape[1:3])
+    return (w, h)
+
+
+def embed(batch: np.ndarray) -> np.ndarray:
+    """
+    ArcFace forward pass on a preprocessed NHWC batch.
+    """
+    sess = session("arcface")
+    return sess.run(None, {sess.get_inputs()[0].name: batch.astype(np.float32)})[0]
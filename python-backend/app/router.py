@@ -0,0 +1,200 @@
+import asyncio
+import itertools
+import re
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv(dotenv_path=".env.local", override=True)
+
+import aiohttp
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from app import sharding
+from app.helpers import ADMIN_TOKEN, require_admin
+
+# Thin router of a sharded deployment: forwards each request carrying an
+# event id to the shard owning that event (sharding.HashRing), everything
+# else to any shard, and streams the response back as it comes. Run it in
+# front of the shards, e.g.
+#   SHARDS=http://127.0.0.1:8101,http://127.0.0.1:8102 uvicorn app.router:app --port 8000
+# or start a whole local deployment with scripts/run_shards.py.
+app = FastAPI(title="FindMyPix router")
+
+# (methods, path) routed by the event id they carry; DELETE /images/{id}
+# and DELETE /subscriptions/{id} take other ids and go to any shard
+EVENT_ROUTES = [
+    (None, re.compile(r"^/events/(\d+)(?:/|$)")),
+    (None, re.compile(r"^/(?:videos|match)/(\d+)(?:/|$)")),
+    ({"GET", "POST", "HEAD", "OPTIONS"}, re.compile(r"^/(?:images|subscriptions)/(\d+)(?:/|$)")),
+]
+HOP_HEADERS = {"host", "connection", "content-length", "transfer-encoding", "keep-alive"}
+
+_session: Optional[aiohttp.ClientSession] = None
+_any_shard = itertools.count()
+_ring_lock = asyncio.Lock()
+
+
+class ShardIn(BaseModel):
+    url: str
+
+
+@app.on_event("startup")
+async def on_startup():
+    global _session
+    # no total timeout: uploads and streamed searches may take a while
+    _session = aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=None, sock_connect=10),
+        auto_decompress=False,
+    )
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await _session.close()
+
+
+def event_of(method: str, path: str) -> Optional[int]:
+    for methods, pattern in EVENT_ROUTES:
+        m = pattern.match(path)
+        if m and (methods is None or method in methods):
+            return int(m.group(1))
+    return None
+
+
+def pick_shard(method: str, path: str) -> str:
+    ring = sharding.ring
+    if not ring.shards:
+        raise HTTPException(503, detail="No shards configured")
+    event_id = event_of(method, path)
+    if event_id is not None:
+        return ring.owner(event_id)
+    return ring.shards[next(_any_shard) % len(ring.shards)]
+
+
+async def forward(shard: str, request: Request, body=None) -> aiohttp.ClientResponse:
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_HEADERS}
+    if body is None and (
+        "content-length" in request.headers or "transfer-encoding" in request.headers
+    ):
+        body = request.stream()
+    try:
+        return await _session.request(
+            request.method,
+            f"{shard}{request.url.path}",
+            params=list(request.query_params.multi_items()),
+            headers=headers,
+            data=body,
+            allow_redirects=False,
+        )
+    except aiohttp.ClientError as e:
+        print(f"Shard {shard} unreachable: {e}")
+        raise HTTPException(503, detail="Shard unavailable")
+
+
+def relay(shard: str, upstream: aiohttp.ClientResponse) -> StreamingResponse:
+    async def body():
+        try:
+            async for chunk in upstream.content.iter_any():
+                yield chunk
+        finally:
+            upstream.release()
+
+    headers = {k: v for k, v in upstream.headers.items() if k.lower() not in HOP_HEADERS}
+    headers["X-Shard"] = shard
+    return StreamingResponse(body(), status_code=upstream.status, headers=headers)
+
+
+async def push_ring(shards: List[str], targets: List[str]) -> Dict[str, dict]:
+    """
+    Sends the ring to every target shard, authenticated with the router's
+    own ADMIN_TOKEN; a refused push aborts the change.
+    """
+    headers = {"X-Admin-Token": ADMIN_TOKEN}
+
+    async def push(shard: str):
+        try:
+            async with _session.put(
+                f"{shard}/admin/ring", json={"shards": shards}, headers=headers
+            ) as resp:
+                return shard, resp.status, await resp.json(content_type=None)
+        except aiohttp.ClientError as e:
+            print(f"Shard {shard} unreachable: {e}")
+            return shard, 503, {"detail": "Shard unavailable"}
+
+    results = await asyncio.gather(*(push(shard) for shard in targets))
+    for shard, status, data in results:
+        if status != 200:
+            raise HTTPException(status, detail=f"{shard}: {data.get('detail', data)}")
+    return {shard: data for shard, _, data in results}
+
+
+async def change_ring(shards: List[str]) -> dict:
+    """
+    Rebalances: the new ring is pushed to every shard, old and new, then
+    adopted here. Only the events whose owner changed move.
+    """
+    old = sharding.ring
+    new = old.with_shards(shards)
+    results = await push_ring(new.shards, sorted(set(old.shards) | set(new.shards)))
+    sharding.ring = new
+    return {
+        "shards": new.shards,
+        "moved_share": round(old.moved_share(new), 4),
+        "spread": new.spread(),
+        "dropped_cache_entries": {s: r["dropped_cache_entries"] for s, r in results.items()},
+    }
+
+
+@app.get("/router/ring")
+async def get_ring():
+    ring = sharding.ring
+    return {"shards": ring.shards, "vnodes": ring.vnodes, "spread": ring.spread()}
+
+
+# ring changes decide where user uploads and tokens are sent: operators only
+@app.post("/router/shards", dependencies=[Depends(require_admin)])
+async def add_shard(payload: ShardIn):
+    url = payload.url.rstrip("/")
+    async with _ring_lock:
+        if url in sharding.ring.shards:
+            raise HTTPException(409, detail="Shard already in the ring")
+        return await change_ring(sharding.ring.shards + [url])
+
+
+@app.delete("/router/shards", dependencies=[Depends(require_admin)])
+async def remove_shard(url: str):
+    url = url.rstrip("/")
+    async with _ring_lock:
+        if url not in sharding.ring.shards:
+            raise HTTPException(404, detail="Shard not in the ring")
+        if len(sharding.ring.shards) == 1:
+            raise HTTPException(400, detail="Cannot remove the last shard")
+        return await change_ring([s for s in sharding.ring.shards if s != url])
+
+
+@app.get("/router/health")
+async def health():
+    return {"status": "ok", "shards": len(sharding.ring.shards)}
+
+
+@app.api_route("/jobs/{job_id}", methods=["GET"])
+async def get_job(job_id: str, request: Request):
+    # jobs live in the memory of the shard that started them
+    for shard in sharding.ring.shards:
+        upstream = await forward(shard, request)
+        if upstream.status != 404:
+            return relay(shard, upstream)
+        upstream.release()
+    raise HTTPException(404, "Job not found")
+
+
+@app.api_route(
+    "/{path:path}",
+    methods=["GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"],
+)
+async def proxy(path: str, request: Request):
+    shard = pick_shard(request.method, request.url.path)
+    return relay(shard, await forward(shard, request))
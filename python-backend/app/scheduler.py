@@ -0,0 +1,165 @@
+import asyncio
+import functools
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Literal, Optional
+
+import numpy as np
+
+# Inference jobs allowed to run at once (roughly one per core the models
+# may use). Bulk work never takes the last INTERACTIVE_RESERVED_SLOTS.
+INFERENCE_SLOTS = int(os.getenv("INFERENCE_SLOTS", "4"))
+INTERACTIVE_RESERVED_SLOTS = int(os.getenv("INTERACTIVE_RESERVED_SLOTS", "1"))
+# queue-wait samples kept per lane for the stats
+WAIT_SAMPLES = 1024
+
+Lane = Literal["interactive", "bulk"]
+LANES = ("interactive", "bulk")
+
+
+class PriorityScheduler:
+    """
+    Runs blocking inference calls on a dedicated thread pool with two
+    lanes. A freed slot always goes to waiting interactive work (searches)
+    first; bulk work (ingestion) only runs in the slots left after the
+    reserved ones. Long bulk jobs call checkpoint() between batches to hand
+    their slot to waiting interactive work.
+
+    Waiting happens on the event loop, not in threads, so a burst of bulk
+    jobs cannot exhaust the threads interactive work needs. Jobs parked in
+    checkpoint() do keep their thread, so at most max_workers - slots of
+    them park at once and every slot holder always finds a thread.
+    """
+
+    def __init__(self, slots: int = INFERENCE_SLOTS, reserved: int = INTERACTIVE_RESERVED_SLOTS):
+        self.slots = max(1, slots)
+        # bulk always keeps at least one slot
+        self.reserved = max(0, min(reserved, self.slots - 1))
+        # spare threads for jobs parked in checkpoint()
+        workers = 2 * self.slots
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+        self._max_parked = workers - self.slots
+        self._parked = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._waiting: Dict[str, Deque[asyncio.Future]] = {lane: deque() for lane in LANES}
+        self._running: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._waits: Dict[str, Deque[float]] = {
+            lane: deque(maxlen=WAIT_SAMPLES) for lane in LANES}
+        self._completed: Dict[str, int] = {lane: 0 for lane in LANES}
+        self.preemptions = 0
+
+    def _can_start(self, lane: str) -> bool:
+        if sum(self._running.values()) >= self.slots:
+            return False
+        if lane == "bulk":
+            return self._running["bulk"] < self.slots - self.reserved
+        return True
+
+    def _dispatch(self) -> None:
+        for lane in LANES:
+            waiting = self._waiting[lane]
+            while waiting and self._can_start(lane):
+                fut = waiting.popleft()
+                if fut.done():
+                    continue
+                self._running[lane] += 1
+                fut.set_result(None)
+
+    def _release(self, lane: str) -> None:
+        self._running[lane] -= 1
+        self._dispatch()
+
+    async def _acquire(self, lane: str, front: bool = False) -> None:
+        # front: a preempted job, resumed before jobs that have not started
+        started = time.monotonic()
+        queued_ahead = self._waiting["interactive"] or (
+            lane == "bulk" and self._waiting["bulk"] and not front)
+        if not queued_ahead and self._can_start(lane):
+            self._running[lane] += 1
+        else:
+            fut = self._loop.create_future()
+            if front:
+                self._waiting[lane].appendleft(fut)
+            else:
+                self._waiting[lane].append(fut)
+            # waiters that gave up may be all that is queued ahead
+            self._dispatch()
+            try:
+                await fut
+            except asyncio.CancelledError:
+                # granted just before the caller went away
+                if fut.done() and not fut.cancelled():
+                    self._release(lane)
+                raise
+        self._waits[lane].append(time.monotonic() - started)
+
+    async def run(self, lane: Lane, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Runs fn(*args, **kwargs) in the pool once `lane` gets a slot.
+        """
+        self._loop = asyncio.get_running_loop()
+        await self._acquire(lane)
+        try:
+            cf = self._executor.submit(functools.partial(fn, *args, **kwargs))
+        except BaseException:
+            self._release(lane)
+            raise
+
+        def done(_):
+            self._completed[lane] += 1
+            self._release(lane)
+
+        # the slot is freed when the thread finishes, even if the caller
+        # stopped waiting for it
+        cf.add_done_callback(lambda f: self._loop.call_soon_threadsafe(done, f))
+        return await asyncio.wrap_future(cf)
+
+    def checkpoint(self, lane: Lane = "bulk") -> None:
+        """
+        Called from inside a running job, between two batches: if
+        interactive work is waiting, gives the slot up and blocks until the
+        job gets one back, ahead of bulk jobs not started yet. Does not yield
+        while the spare threads are all taken by parked jobs.
+        """
+        if lane == "interactive" or not self._waiting["interactive"]:
+            return
+
+        async def requeue():
+            # decided on the loop, where the counters are updated
+            if not self._waiting["interactive"] or self._parked >= self._max_parked:
+                return
+            self.preemptions += 1
+            self._parked += 1
+            self._release(lane)
+            try:
+                await self._acquire(lane, front=True)
+            finally:
+                self._parked -= 1
+
+        asyncio.run_coroutine_threadsafe(requeue(), self._loop).result()
+
+    def stats(self) -> Dict[str, Any]:
+        lanes = {}
+        for lane in LANES:
+            waits = np.array(self._waits[lane] or [0.0]) * 1000.0
+            lanes[lane] = {
+                "running": self._running[lane],
+                "waiting": len(self._waiting[lane]),
+                "completed": self._completed[lane],
+                "wait_ms_mean": round(float(waits.mean()), 2),
+                "wait_ms_p50": round(float(np.percentile(waits, 50)), 2),
+                "wait_ms_p95": round(float(np.percentile(waits, 95)), 2),
+                "wait_ms_max": round(float(waits.max()), 2),
+            }
+        return {
+            "slots": self.slots,
+            "reserved_interactive": self.reserved,
+            "preemptions": self.preemptions,
+            "parked": self._parked,
+            "lanes": lanes,
+        }
+
+
+inference_scheduler = PriorityScheduler()
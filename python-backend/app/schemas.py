@@ -1,4 +1,4 @@
-from typing import List, Optional, Dict
+from typing import Any, List, Optional, Dict
 from uuid import UUID
 from pydantic import BaseModel, ConfigDict
 from datetime import datetime
@@ -9,7 +9,8 @@ class EmbeddingIn(BaseModel):
     y: float
     w: float
     h: float
-    vector: List[float]
+    vector: Optional[List[float]] = None
+    quality: Optional[float] = None
 
 
 class EmbeddingOut(BaseModel):
@@ -19,6 +20,8 @@ class EmbeddingOut(BaseModel):
     y: float
     w: float
     h: float
+    quality: Optional[float] = None
+    timestamp: Optional[float] = None
 
 
 class EventIn(BaseModel):
@@ -44,6 +47,7 @@ class ImageCreate(BaseModel):
 class ImageOut(BaseModel):
     id: int
     path: str
+    media_type: str = "image"
     embeddings: List[EmbeddingOut]
 
 
@@ -55,3 +59,56 @@ class MatchResult(BaseModel):
     threshold: float
     bbox: Dict[str, int]
     other_embeddings: List[EmbeddingOut]
+    # position of the hit in a video, in seconds
+    timestamp: Optional[float] = None
+
+
+class EventMatches(BaseModel):
+    event_id: int
+    results: List[MatchResult]
+
+
+class SubscriptionOut(BaseModel):
+    id: int
+    event_id: int
+    active: bool
+    created_at: datetime
+    match_count: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class BulkDeleteIn(BaseModel):
+    ids: List[int]
+
+
+class RingIn(BaseModel):
+    # base URLs of every shard, this one included
+    shards: List[str]
+
+
+class JobOut(BaseModel):
+    id: str
+    kind: str
+    status: str
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    result: Dict[str, Any] = {}
+    error: Optional[str] = None
+
+
+class SpriteTile(BaseModel):
+    sheet: int
+    x: int
+    y: int
+
+
+class SpriteIndexOut(BaseModel):
+    event_id: int
+    version: int
+    tile: int
+    columns: int
+    # sheet paths, served under /files/
+    sheets: List[str]
+    # emb_id -> position of its crop
+    faces: Dict[int, SpriteTile]
@@ -0,0 +1,81 @@
+import bisect
+import hashlib
+import os
+from typing import Dict, List, Optional
+
+# Sharded deployment: every event belongs to one API process (shard), picked
+# by consistent hashing of its id, so its searches always land on the same
+# warm caches and inference worker. All shards share the database. Adding a
+# shard only moves the events that land on its points of the ring.
+SHARDS = [u.strip().rstrip("/") for u in os.getenv("SHARDS", "").split(",") if u.strip()]
+# this process's own entry in SHARDS (empty outside a sharded deployment)
+SHARD_URL = os.getenv("SHARD_URL", "").rstrip("/")
+# points per shard on the ring; more points spread events more evenly
+SHARD_VNODES = int(os.getenv("SHARD_VNODES", "160"))
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent-hash ring of shard URLs. Immutable: a change of membership
+    builds a new ring, so readers never see one half-updated.
+    """
+
+    def __init__(self, shards: List[str], vnodes: int = SHARD_VNODES):
+        self.shards = sorted(set(s.rstrip("/") for s in shards))
+        self.vnodes = vnodes
+        points = sorted(
+            (_hash(f"{shard}#{i}"), shard)
+            for shard in self.shards for i in range(vnodes)
+        )
+        self._keys = [k for k, _ in points]
+        self._owners = [s for _, s in points]
+
+    def owner(self, event_id: int) -> Optional[str]:
+        if not self._keys:
+            return None
+        i = bisect.bisect(self._keys, _hash(str(event_id))) % len(self._keys)
+        return self._owners[i]
+
+    def with_shards(self, shards: List[str]) -> "HashRing":
+        return HashRing(shards, self.vnodes)
+
+    def spread(self, samples: int = 10000) -> Dict[str, float]:
+        """
+        Share of event ids owned by each shard, over the first `samples` ids.
+        """
+        counts = {shard: 0 for shard in self.shards}
+        for event_id in range(1, samples + 1):
+            counts[self.owner(event_id)] += 1
+        return {shard: n / samples for shard, n in counts.items()}
+
+    def moved_share(self, other: "HashRing", samples: int = 10000) -> float:
+        """
+        Share of event ids whose owner differs between the two rings.
+        """
+        moved = sum(
+            self.owner(event_id) != other.owner(event_id)
+            for event_id in range(1, samples + 1)
+        )
+        return moved / samples
+
+
+ring = HashRing(SHARDS)
+
+
+def set_ring(shards: List[str]) -> HashRing:
+    global ring
+    ring = ring.with_shards(shards)
+    return ring
+
+
+def owns(event_id: int) -> bool:
+    """
+    Whether this process serves `event_id` (always, when not sharded).
+    """
+    if not SHARD_URL or not ring.shards:
+        return True
+    return ring.owner(event_id) == SHARD_URL
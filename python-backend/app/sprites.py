@@ -0,0 +1,212 @@
+import asyncio
+import json
+import os
+import shutil
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .crud import get_event_version
+from .files import IMAGE_DIR, image_file
+from .models import Embedding, Event, Image
+
+# Sprite sheets live under IMAGE_DIR so they are served by the /files mount:
+#   /files/_sprites/{event_id}/v{version}/sheet_{n}.jpg
+SPRITE_DIR = "_sprites"
+SPRITE_TILE = int(os.getenv("SPRITE_TILE", "96"))
+SPRITE_COLUMNS = int(os.getenv("SPRITE_COLUMNS", "16"))
+SPRITE_ROWS = int(os.getenv("SPRITE_ROWS", "16"))
+# extra context kept around each bbox, as a fraction of its size
+SPRITE_MARGIN = 0.15
+SPRITE_JPEG_QUALITY = 85
+
+_build_locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+
+def event_sprite_dir(event_id: int) -> str:
+    return os.path.join(IMAGE_DIR, SPRITE_DIR, str(event_id))
+
+
+def _crop(img, x: float, y: float, w: float, h: float):
+    import cv2
+
+    # square crop centred on the face, with a margin, clamped to the image
+    side = max(w, h) * (1 + 2 * SPRITE_MARGIN)
+    cx, cy = x + w / 2, y + h / 2
+    x1, y1 = int(max(0, cx - side / 2)), int(max(0, cy - side / 2))
+    x2 = int(min(img.shape[1], cx + side / 2))
+    y2 = int(min(img.shape[0], cy + side / 2))
+    face = img[y1:y2, x1:x2]
+    if face.size == 0:
+        return None
+    return cv2.resize(face, (SPRITE_TILE, SPRITE_TILE), interpolation=cv2.INTER_AREA)
+
+
+def _read_source(path: str, media_type: str, timestamp: Optional[float]):
+    import cv2
+
+    if media_type == "video":
+        cap = cv2.VideoCapture(image_file(path))
+        try:
+            cap.set(cv2.CAP_PROP_POS_MSEC, (timestamp or 0.0) * 1000.0)
+            ok, frame = cap.read()
+            return frame if ok else None
+        finally:
+            cap.release()
+    return cv2.imread(image_file(path))
+
+
+def _build(rows: List[Dict[str, Any]], out_dir: str) -> Dict[str, Any]:
+    """
+    Cuts every face out of its source image (each image decoded once) and
+    packs the crops into sheets of SPRITE_COLUMNS x SPRITE_ROWS tiles.
+    """
+    import cv2
+    import numpy as np
+
+    per_sheet = SPRITE_COLUMNS * SPRITE_ROWS
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    sheets: List[str] = []
+    faces: Dict[int, Dict[str, int]] = {}
+    sheet = None
+    slot = 0
+
+    def flush():
+        name = f"sheet_{len(sheets)}.jpg"
+        cv2.imwrite(os.path.join(tmp_dir, name), sheet,
+                    [cv2.IMWRITE_JPEG_QUALITY, SPRITE_JPEG_QUALITY])
+        sheets.append(name)
+
+    by_source: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
+    for r in rows:
+        by_source[(r["path"], r["media_type"], r["timestamp"])].append(r)
+
+    for (path, media_type, timestamp), group in by_source.items():
+        img = _read_source(path, media_type, timestamp)
+        if img is None:
+            continue
+        for r in group:
+            tile = _crop(img, r["x"], r["y"], r["w"], r["h"])
+            if tile is None:
+                continue
+            if sheet is None:
+                sheet = np.zeros(
+                    (SPRITE_ROWS * SPRITE_TILE, SPRITE_COLUMNS * SPRITE_TILE, 3), np.uint8)
+            col, row = slot % SPRITE_COLUMNS, slot // SPRITE_COLUMNS
+            x, y = col * SPRITE_TILE, row * SPRITE_TILE
+            sheet[y:y + SPRITE_TILE, x:x + SPRITE_TILE] = tile
+            faces[r["id"]] = {"sheet": len(sheets), "x": x, "y": y}
+            slot += 1
+            if slot == per_sheet:
+                flush()
+                sheet, slot = None, 0
+    if sheet is not None:
+        # trim the unused rows of the last sheet
+        used_rows = (slot + SPRITE_COLUMNS - 1) // SPRITE_COLUMNS
+        sheet = sheet[:used_rows * SPRITE_TILE]
+        flush()
+
+    index = {"sheets": sheets, "faces": faces}
+    with open(os.path.join(tmp_dir, "index.json"), "w") as f:
+        json.dump(index, f)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return index
+
+
+def _load_index(out_dir: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(out_dir, "index.json")) as f:
+            index = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    index["faces"] = {int(k): v for k, v in index["faces"].items()}
+    return index
+
+
+def _remove_other_versions(event_id: int, keep: str) -> None:
+    root = event_sprite_dir(event_id)
+    for name in os.listdir(root):
+        if name != keep:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+async def get_sprite_index(db: AsyncSession, event_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Sprite sheets of every searchable face of the event, built on first
+    request and cached on disk per event version, so they are rebuilt only
+    after the event's photos change. None if the event does not exist.
+    """
+    version = await get_event_version(db, event_id)
+    if version is None:
+        return None
+    name = f"v{version}"
+    out_dir = os.path.join(event_sprite_dir(event_id), name)
+
+    async with _build_locks[event_id]:
+        index = await run_in_threadpool(_load_index, out_dir)
+        if index is None:
+            q = await db.execute(
+                select(
+                    Embedding.id, Embedding.x, Embedding.y, Embedding.w, Embedding.h,
+                    Embedding.timestamp, Image.path, Image.media_type,
+                )
+                .join(Image, Embedding.image_id == Image.id)
+                .where(and_(Embedding.event_id == event_id, Embedding.vector.isnot(None)))
+                .order_by(Embedding.image_id, Embedding.id)
+            )
+            rows = [dict(r) for r in q.mappings().all()]
+            index = await run_in_threadpool(_build, rows, out_dir)
+            await run_in_threadpool(_remove_other_versions, event_id, name)
+
+    prefix = f"{SPRITE_DIR}/{event_id}/{name}"
+    return {
+        "event_id": event_id,
+        "version": version,
+        "tile": SPRITE_TILE,
+        "columns": SPRITE_COLUMNS,
+        "sheets": [f"{prefix}/{sheet}" for sheet in index["sheets"]],
+        "faces": index["faces"],
+    }
+
+
+def remove_event_sprites(event_ids: List[int]) -> None:
+    for event_id in event_ids:
+        shutil.rmtree(event_sprite_dir(event_id), ignore_errors=True)
+
+
+async def gc_sprites(db: AsyncSession, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Removes sprite directories of deleted events and of outdated versions.
+    """
+    root = os.path.join(IMAGE_DIR, SPRITE_DIR)
+    if not os.path.isdir(root):
+        return {"removed": 0}
+    names = await run_in_threadpool(os.listdir, root)
+    event_ids = [int(n) for n in names if n.isdigit()]
+    q = await db.execute(
+        select(Event.id, Event.version).where(Event.id.in_(event_ids))
+    )
+    versions = dict(q.all())
+
+    stale: List[str] = []
+    for event_id in event_ids:
+        event_dir = event_sprite_dir(event_id)
+        if event_id not in versions:
+            stale.append(event_dir)
+            continue
+        current = f"v{versions[event_id]}"
+        stale.extend(
+            os.path.join(event_dir, n)
+            for n in await run_in_threadpool(os.listdir, event_dir) if n != current
+        )
+    if not dry_run:
+        for path in stale:
+            await run_in_threadpool(shutil.rmtree, path, True)
+    return {"removed": len(stale)}
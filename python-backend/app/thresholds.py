@@ -0,0 +1,29 @@
+from typing import Dict
+
+# Verification thresholds per model and distance metric, as published by
+# DeepFace (deepface.modules.verification.find_threshold). Kept as a static
+# table so the API can use them without importing deepface/TensorFlow.
+THRESHOLDS: Dict[str, Dict[str, float]] = {
+    "VGG-Face": {"cosine": 0.68, "euclidean": 1.17, "euclidean_l2": 1.17},
+    "Facenet": {"cosine": 0.40, "euclidean": 10, "euclidean_l2": 0.80},
+    "Facenet512": {"cosine": 0.30, "euclidean": 23.56, "euclidean_l2": 1.04},
+    "ArcFace": {"cosine": 0.68, "euclidean": 4.15, "euclidean_l2": 1.13},
+    "Dlib": {"cosine": 0.07, "euclidean": 0.6, "euclidean_l2": 0.4},
+    "SFace": {"cosine": 0.593, "euclidean": 10.734, "euclidean_l2": 1.055},
+    "OpenFace": {"cosine": 0.10, "euclidean": 0.55, "euclidean_l2": 0.55},
+    "DeepFace": {"cosine": 0.23, "euclidean": 64, "euclidean_l2": 0.64},
+    "DeepID": {"cosine": 0.015, "euclidean": 45, "euclidean_l2": 0.17},
+    "GhostFaceNet": {"cosine": 0.65, "euclidean": 35.71, "euclidean_l2": 1.10},
+}
+
+_BASE_THRESHOLD = {"cosine": 0.40, "euclidean": 0.55, "euclidean_l2": 0.75}
+
+
+def find_threshold(model_name: str, distance_metric: str) -> float:
+    """
+    Same contract as DeepFace.verification.find_threshold.
+    """
+    thresholds = THRESHOLDS.get(model_name, _BASE_THRESHOLD)
+    if distance_metric not in thresholds:
+        raise ValueError(f"Invalid distance_metric passed - {distance_metric}")
+    return thresholds[distance_metric]
@@ -0,0 +1,77 @@
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+
+from .thresholds import find_threshold
+
+
+def distance_matrix(
+    queries: Union[np.ndarray, List[List[float]]],
+    candidates: Union[np.ndarray, List[List[float]]],
+    distance_metric: str = "cosine",
+) -> np.ndarray:
+    """
+    (M x N) distances between the rows of `queries` (M x D) and
+    `candidates` (N x D), computed with a single matrix product.
+    Supports the DeepFace metrics: cosine, euclidean, euclidean_l2.
+    """
+    q = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    c = np.atleast_2d(np.asarray(candidates, dtype=np.float32))
+    if distance_metric in ("cosine", "euclidean_l2"):
+        q = q / np.maximum(np.linalg.norm(q, axis=1, keepdims=True), 1e-12)
+        c = c / np.maximum(np.linalg.norm(c, axis=1, keepdims=True), 1e-12)
+    dot = q @ c.T
+    if distance_metric == "cosine":
+        return 1.0 - dot
+    if distance_metric in ("euclidean", "euclidean_l2"):
+        sq = (q * q).sum(axis=1)[:, None] + (c * c).sum(axis=1)[None, :] - 2 * dot
+        return np.sqrt(np.maximum(sq, 0.0))
+    raise ValueError(f"Invalid distance_metric passed - {distance_metric}")
+
+
+def match_embedding_matrix(
+    queries: Union[np.ndarray, List[List[float]]],
+    candidates: Union[np.ndarray, List[List[float]]],
+    model_name: str = "ArcFace",
+    distance_metric: str = "cosine",
+    threshold: Optional[float] = None,
+    top_k: int = 10,
+    chunk_size: int = 4096,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Many-to-many matching of (M x 512) queries against (N x 512) candidates.
+
+    Candidates are processed `chunk_size` rows at a time while a running
+    top-k is kept per query, so memory stays at M x (top_k + chunk_size).
+    Distances above `threshold` (the model+metric threshold by default)
+    are discarded.
+
+    Returns (indices, distances), both M x top_k and sorted by distance.
+    Slots without a match hold index -1 and distance inf.
+    """
+    if threshold is None:
+        threshold = find_threshold(model_name, distance_metric)
+    q = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    c = np.atleast_2d(np.asarray(candidates, dtype=np.float32))
+    m, n = q.shape[0], c.shape[0] if c.size else 0
+
+    best_d = np.full((m, top_k), np.inf, dtype=np.float32)
+    best_i = np.full((m, top_k), -1, dtype=np.int64)
+    for start in range(0, n, chunk_size):
+        d = distance_matrix(q, c[start:start + chunk_size], distance_metric)
+        d = d.astype(np.float32, copy=False)
+        d[d > threshold] = np.inf
+        idx = np.broadcast_to(
+            np.arange(start, start + d.shape[1], dtype=np.int64), d.shape)
+
+        all_d = np.concatenate([best_d, d], axis=1)
+        all_i = np.concatenate([best_i, idx], axis=1)
+        keep = np.argpartition(all_d, top_k - 1, axis=1)[:, :top_k]
+        best_d = np.take_along_axis(all_d, keep, axis=1)
+        best_i = np.take_along_axis(all_i, keep, axis=1)
+
+    order = np.argsort(best_d, axis=1, kind="stable")
+    best_d = np.take_along_axis(best_d, order, axis=1)
+    best_i = np.take_along_axis(best_i, order, axis=1)
+    best_i[np.isinf(best_d)] = -1
+    return best_i, best_d
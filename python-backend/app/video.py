@@ -0,0 +1,180 @@
+import os
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app import face_lib
+from app.vector_ops import distance_matrix
+
+# Bhattacharyya distance between HSV histograms that marks a scene cut.
+VIDEO_SCENE_THRESHOLD = float(os.getenv("VIDEO_SCENE_THRESHOLD", "0.4"))
+# Mean absolute difference (0-255) of downscaled grey frames that counts
+# as enough motion to sample again.
+VIDEO_MOTION_THRESHOLD = float(os.getenv("VIDEO_MOTION_THRESHOLD", "12"))
+# Sampled frames are at least MIN_GAP and at most MAX_GAP seconds apart.
+VIDEO_MIN_GAP = float(os.getenv("VIDEO_MIN_GAP", "0.3"))
+VIDEO_MAX_GAP = float(os.getenv("VIDEO_MAX_GAP", "3.0"))
+# Embeddings kept per face track.
+VIDEO_FACES_PER_TRACK = int(os.getenv("VIDEO_FACES_PER_TRACK", "3"))
+# A face continues a track if its box overlaps the track's last box this
+# much, or its embedding is this close (cosine) to the track's last one.
+TRACK_MIN_IOU = 0.3
+TRACK_MAX_DISTANCE = 0.4
+# frames are compared every ANALYSIS_STEP seconds, not on every frame
+ANALYSIS_STEP = 0.1
+
+_THUMB = (64, 36)
+
+
+def _signature(frame: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, [16, 16], [0, 180, 0, 256])
+    cv2.normalize(hist, hist)
+    grey = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), _THUMB,
+                      interpolation=cv2.INTER_AREA)
+    return hist, grey.astype(np.float32)
+
+
+def sample_frames(path: str) -> Iterator[Tuple[float, np.ndarray, bool]]:
+    """
+    Yields (timestamp, frame, scene_cut) for the frames worth running face
+    detection on: the first frame, every scene cut, frames after enough
+    motion (at most one per VIDEO_MIN_GAP), and at least one frame per
+    VIDEO_MAX_GAP of a static shot.
+    """
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video at {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    step = max(1, int(round(fps * ANALYSIS_STEP)))
+    last_sig: Optional[Tuple[np.ndarray, np.ndarray]] = None
+    last_t = -VIDEO_MAX_GAP
+    index = 0
+    try:
+        while True:
+            if not cap.grab():
+                break
+            if index % step:
+                index += 1
+                continue
+            ok, frame = cap.retrieve()
+            index += 1
+            if not ok:
+                continue
+            t = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0 or (index - 1) / fps
+
+            sig = _signature(frame)
+            if last_sig is None:
+                yield t, frame, True
+                last_sig, last_t = sig, t
+                continue
+            cut = cv2.compareHist(
+                last_sig[0], sig[0], cv2.HISTCMP_BHATTACHARYYA) > VIDEO_SCENE_THRESHOLD
+            motion = float(np.mean(np.abs(sig[1] - last_sig[1])))
+            gap = t - last_t
+            if cut or gap >= VIDEO_MAX_GAP or (
+                motion > VIDEO_MOTION_THRESHOLD and gap >= VIDEO_MIN_GAP
+            ):
+                yield t, frame, cut
+                last_sig, last_t = sig, t
+    finally:
+        cap.release()
+
+
+def _iou(a: Dict[str, Any], b: Dict[str, Any]) -> float:
+    x1, y1 = max(a["x"], b["x"]), max(a["y"], b["y"])
+    x2 = min(a["x"] + a["w"], b["x"] + b["w"])
+    y2 = min(a["y"] + a["h"], b["y"] + b["h"])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = a["w"] * a["h"] + b["w"] * b["h"] - inter
+    return inter / union if union else 0.0
+
+
+class FaceTrack:
+    """
+    One person followed across adjacent sampled frames; keeps the best
+    VIDEO_FACES_PER_TRACK faces by quality as its representatives.
+    """
+
+    def __init__(self, track_id: int, face: Dict[str, Any]):
+        self.id = track_id
+        self.faces: List[Dict[str, Any]] = []
+        self.add(face)
+
+    def add(self, face: Dict[str, Any]) -> None:
+        self.last = face
+        self.faces.append(face)
+        self.faces.sort(key=lambda f: f.get("quality") or 0.0, reverse=True)
+        del self.faces[VIDEO_FACES_PER_TRACK:]
+
+
+def _assign(tracks: List[FaceTrack], faces: List[Dict[str, Any]]) -> List[Optional[FaceTrack]]:
+    """
+    Greedy matching of this frame's faces to the open tracks, closest
+    embedding first; a track takes at most one face per frame.
+    """
+    owners: List[Optional[FaceTrack]] = [None] * len(faces)
+    if not tracks or not faces:
+        return owners
+    dists = distance_matrix(
+        [f["embedding"] for f in faces], [t.last["embedding"] for t in tracks])
+    taken = set()
+    for flat in np.argsort(dists, axis=None):
+        i, j = np.unravel_index(flat, dists.shape)
+        if owners[i] is not None or j in taken:
+            continue
+        track = tracks[j]
+        if dists[i, j] <= TRACK_MAX_DISTANCE or \
+                _iou(faces[i]["facial_area"], track.last["facial_area"]) >= TRACK_MIN_IOU:
+            owners[i] = track
+            taken.add(j)
+    return owners
+
+
+def get_video_embeddings(
+    path: str,
+    between_frames: Optional[Callable[[], None]] = None,
+    **kwargs: Any,
+) -> List[Dict[str, Any]]:
+    """
+    Samples frames on scene and motion changes, embeds their faces and
+    tracks them across adjacent samples, so a person on screen for a whole
+    shot yields a few representative embeddings instead of one per frame.
+    Each result is a get_embeddings dict plus "timestamp" (seconds) and
+    "track". `between_frames` is called before each sampled frame is
+    embedded (the scheduler's preemption point).
+    """
+    open_tracks: List[FaceTrack] = []
+    done: List[FaceTrack] = []
+    next_id = 0
+    for t, frame, cut in sample_frames(path):
+        if cut:
+            done.extend(open_tracks)
+            open_tracks = []
+        # tracks that were not seen for a while are finished
+        still_open = []
+        for track in open_tracks:
+            (still_open if t - track.last["timestamp"] <= 2 * VIDEO_MAX_GAP else done).append(track)
+        open_tracks = still_open
+
+        if between_frames is not None:
+            between_frames()
+        faces = [
+            dict(face, timestamp=round(t, 3))
+            for face in face_lib.get_embeddings(frame, **kwargs)
+            if face["embedding"] is not None
+        ]
+        for face, track in zip(faces, _assign(open_tracks, faces)):
+            if track is None:
+                open_tracks.append(FaceTrack(next_id, face))
+                next_id += 1
+            else:
+                track.add(face)
+    done.extend(open_tracks)
+
+    out: List[Dict[str, Any]] = []
+    for track in done:
+        for face in sorted(track.faces, key=lambda f: f["timestamp"]):
+            out.append(dict(face, track=track.id))
+    return out
@@ -0,0 +1,130 @@
+import os
+from typing import Any, Dict, List
+from dotenv import load_dotenv
+
+load_dotenv(dotenv_path=".env.local", override=True)
+
+import numpy as np
+from fastapi import FastAPI, Header, HTTPException, Request, UploadFile, File
+from pydantic import BaseModel
+
+from app import face_lib, video
+from app.scheduler import Lane, inference_scheduler
+
+# Inference service: owns TensorFlow and the face models so the API tier
+# stays light. Run it next to the API, e.g.
+#   uvicorn app.worker:app --host 127.0.0.1 --port 8001
+# and point the API at it with INFERENCE_URL=http://127.0.0.1:8001
+app = FastAPI(title="FindMyPix inference")
+
+
+class EmbedIn(BaseModel):
+    path: str
+    crowded: bool = False
+
+
+def plain(value: Any) -> Any:
+    """
+    Converts numpy values in face_lib results into JSON-friendly types.
+    """
+    if isinstance(value, dict):
+        return {k: plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+@app.on_event("startup")
+def on_startup():
+    face_lib.warm_up()
+
+
+@app.post("/embed")
+async def embed(payload: EmbedIn, x_priority: Lane = Header("bulk")) -> Dict[str, Any]:
+    if not os.path.isfile(payload.path):
+        raise HTTPException(404, detail=f"No such file: {payload.path}")
+    try:
+        faces = await inference_scheduler.run(
+            x_priority, face_lib.get_embeddings, payload.path, crowded=payload.crowded)
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+    return {"faces": plain(faces)}
+
+
+@app.post("/embed/bytes")
+async def embed_bytes(
+    request: Request, crowded: bool = False, x_priority: Lane = Header("bulk")
+) -> Dict[str, Any]:
+    """
+    Embeds the encoded image sent as the raw request body.
+    """
+    data = await request.body()
+    try:
+        faces = await inference_scheduler.run(
+            x_priority, face_lib.get_embeddings, data, crowded=crowded)
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+    return {"faces": plain(faces)}
+
+
+@app.post("/detect/bytes")
+async def detect_bytes(request: Request, x_priority: Lane = Header("bulk")) -> Dict[str, Any]:
+    """
+    Fast-detector face boxes of the encoded image sent as the request body.
+    """
+    data = await request.body()
+    try:
+        boxes = await inference_scheduler.run(x_priority, face_lib.detect_boxes, data)
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+    return {"boxes": plain(boxes)}
+
+
+@app.post("/embed/batch")
+async def embed_batch(
+    files: List[UploadFile] = File(...), x_priority: Lane = Header("interactive")
+) -> Dict[str, Any]:
+    images = [await f.read() for f in files]
+    try:
+        results = await inference_scheduler.run(
+            x_priority, face_lib.get_embeddings_batch, images)
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+    # per image: its faces, or why it failed
+    return {"results": [
+        {"error": str(r)} if isinstance(r, Exception) else {"faces": plain(r)}
+        for r in results
+    ]}
+
+
+@app.post("/embed_video")
+async def embed_video(payload: EmbedIn, x_priority: Lane = Header("bulk")) -> Dict[str, Any]:
+    if not os.path.isfile(payload.path):
+        raise HTTPException(404, detail=f"No such file: {payload.path}")
+    try:
+        faces = await inference_scheduler.run(
+            x_priority, video.get_video_embeddings, payload.path,
+            between_frames=lambda: inference_scheduler.checkpoint(x_priority),
+        )
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+    return {"faces": plain(faces)}
+
+
+@app.get("/stats/detector")
+def detector_stats():
+    return face_lib.cascade_stats()
+
+
+@app.get("/stats/scheduler")
+def scheduler_stats():
+    return inference_scheduler.stats()
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok"}
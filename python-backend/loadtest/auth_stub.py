@@ -0,0 +1,29 @@
+"""
+Stand-in for the NextAuth /api/auth/validate route used by
+app.helpers.validate_token. Every token is valid and maps to a stable user
+id, so the load generator can act as many users without a frontend:
+
+    uvicorn loadtest.auth_stub:app --port 3999
+    NEXTAUTH_URL=http://127.0.0.1:3999 uvicorn app.main:app
+"""
+import uuid
+
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+app = FastAPI(title="FindMyPix auth stub")
+
+_NAMESPACE = uuid.UUID("6f1c0c3e-2b8a-4f7e-9d43-1a0c5e7b9f21")
+
+
+class TokenIn(BaseModel):
+    token: str
+
+
+@app.post("/api/auth/validate")
+async def validate(payload: TokenIn):
+    user_id = str(uuid.uuid5(_NAMESPACE, payload.token))
+    return {
+        "valid": True,
+        "user": {"id": user_id, "name": payload.token, "email": f"{payload.token}@loadtest.local"},
+    }
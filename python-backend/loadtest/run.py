@@ -0,0 +1,408 @@
+"""
+Load generator for the FindMyPix API: drives a mix of upload, match, list
+and event requests at a target rate (open loop, Poisson arrivals), ramps
+the rate to find the saturation point and writes a JSON report.
+
+    python -m loadtest.run run --ramp 5:60:5 --out report.json
+    python -m loadtest.run compare baseline.json report.json
+
+Start the API with INFERENCE_BACKEND=fake and NEXTAUTH_URL pointing at
+loadtest.auth_stub, see README.md.
+"""
+import argparse
+import asyncio
+import io
+import json
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+import numpy as np
+from PIL import Image as PILImage
+
+REPORT_FORMAT = 1
+DEFAULT_MIX = "upload=2,match=3,match_id=2,list_images=4,list_events=2,get_event=2,create_event=1"
+# queries reuse an uploaded photo this often, so most of them find matches
+QUERY_REUSE = 0.7
+IMAGE_POOL = 256
+
+
+def make_image(rng: random.Random) -> bytes:
+    pixels = np.random.default_rng(rng.getrandbits(32)).integers(
+        0, 256, (96, 96, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    PILImage.fromarray(pixels).save(buf, format="JPEG", quality=80)
+    return buf.getvalue()
+
+
+class State:
+    """
+    What the client knows about the data it created: users, their events,
+    uploaded photos and the embedding ids they produced.
+    """
+
+    def __init__(self, users: int, seed: int):
+        self.rng = random.Random(seed)
+        self.run_id = uuid.uuid4().hex[:8]
+        self.tokens = [f"loadtest-{i}" for i in range(users)]
+        self.events: Dict[str, List[int]] = defaultdict(list)
+        self.embeddings: Dict[int, List[int]] = defaultdict(list)
+        self.photos: List[bytes] = []
+        self.uploads = 0
+
+    def user(self) -> str:
+        return self.rng.choice(self.tokens)
+
+    def event(self, token: Optional[str] = None) -> int:
+        return self.rng.choice(self.events[token or self.user()])
+
+    def all_events(self) -> List[int]:
+        return [e for evs in self.events.values() for e in evs]
+
+    def query_photo(self) -> bytes:
+        if self.photos and self.rng.random() < QUERY_REUSE:
+            return self.rng.choice(self.photos)
+        return make_image(self.rng)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.dropped = 0
+
+    def add(self, op: str, ms: float, status: Any) -> None:
+        self.latencies[op].append(ms)
+        self.statuses[op][str(status)] += 1
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        endpoints = {}
+        total = ok = 0
+        for op, values in sorted(self.latencies.items()):
+            arr = np.array(values)
+            errors = sum(n for s, n in self.statuses[op].items() if not s.startswith("2"))
+            total += len(values)
+            ok += len(values) - errors
+            endpoints[op] = {
+                "count": len(values),
+                "errors": errors,
+                "statuses": dict(self.statuses[op]),
+                "mean_ms": round(float(arr.mean()), 2),
+                "p50_ms": round(float(np.percentile(arr, 50)), 2),
+                "p95_ms": round(float(np.percentile(arr, 95)), 2),
+                "p99_ms": round(float(np.percentile(arr, 99)), 2),
+            }
+        every = np.array([v for values in self.latencies.values() for v in values] or [0.0])
+        return {
+            "requests": total,
+            "ok": ok,
+            "error_rate": round((total - ok) / total, 4) if total else 0.0,
+            "dropped": self.dropped,
+            "achieved_rps": round(ok / elapsed, 2) if elapsed else 0.0,
+            "p99_ms": round(float(np.percentile(every, 99)), 2),
+            "endpoints": endpoints,
+        }
+
+
+async def call(session, rec, op, token, method, url, **kwargs):
+    started = time.perf_counter()
+    body = None
+    try:
+        async with session.request(
+            method, url, headers={"Authorization": f"Bearer {token}"}, **kwargs
+        ) as r:
+            status = r.status
+            if status < 300 and r.content_type == "application/json":
+                body = await r.json()
+            else:
+                await r.read()
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        status = "error"
+    if rec is not None:
+        rec.add(op, (time.perf_counter() - started) * 1000.0, status)
+    return body
+
+
+def photo_form(data: bytes, name: str) -> aiohttp.FormData:
+    form = aiohttp.FormData()
+    form.add_field("file", data, filename=name, content_type="image/jpeg")
+    return form
+
+
+async def op_upload(session, state, rec, base):
+    token = state.user()
+    data = make_image(state.rng)
+    state.uploads += 1
+    name = f"lt-{state.run_id}-{state.uploads}.jpg"
+    event_id = state.event(token)
+    out = await call(session, rec, "upload", token, "POST", f"{base}/images/{event_id}",
+                     data=photo_form(data, name))
+    if out:
+        state.photos.append(data)
+        del state.photos[:-IMAGE_POOL]
+        state.embeddings[event_id].extend(e["id"] for e in out["embeddings"])
+
+
+async def op_match(session, state, rec, base):
+    await call(session, rec, "match", state.user(), "POST", f"{base}/match/{state.event()}",
+               data=photo_form(state.query_photo(), "query.jpg"))
+
+
+async def op_match_id(session, state, rec, base):
+    candidates = [e for e, ids in state.embeddings.items() if ids]
+    if not candidates:
+        return await op_match(session, state, rec, base)
+    event_id = state.rng.choice(candidates)
+    emb_id = state.rng.choice(state.embeddings[event_id])
+    await call(session, rec, "match_id", state.user(), "GET", f"{base}/match/{event_id}/{emb_id}")
+
+
+async def op_list_images(session, state, rec, base):
+    await call(session, rec, "list_images", state.user(), "GET", f"{base}/images/{state.event()}")
+
+
+async def op_list_events(session, state, rec, base):
+    await call(session, rec, "list_events", state.user(), "GET", f"{base}/events/my")
+
+
+async def op_get_event(session, state, rec, base):
+    await call(session, rec, "get_event", state.user(), "GET", f"{base}/events/{state.event()}")
+
+
+async def op_create_event(session, state, rec, base, token=None):
+    token = token or state.user()
+    out = await call(session, rec, "create_event", token, "POST", f"{base}/events", json={
+        "title": f"loadtest {state.run_id}",
+        "date": datetime.now(timezone.utc).isoformat(),
+    })
+    if out:
+        state.events[token].append(out["id"])
+
+
+OPS = {
+    "upload": op_upload,
+    "match": op_match,
+    "match_id": op_match_id,
+    "list_images": op_list_images,
+    "list_events": op_list_events,
+    "get_event": op_get_event,
+    "create_event": op_create_event,
+}
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPS:
+            raise SystemExit(f"Unknown operation {name!r}, expected one of {sorted(OPS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def setup(session, state, base, events_per_user, seed_photos):
+    for token in state.tokens:
+        for _ in range(events_per_user):
+            await op_create_event(session, state, None, base, token)
+    if not state.all_events():
+        raise SystemExit("Could not create events, is the API (and the auth stub) running?")
+    for _ in range(seed_photos):
+        await op_upload(session, state, None, base)
+
+
+async def cleanup(session, state, base):
+    for token, event_ids in state.events.items():
+        await call(session, None, "cleanup", token, "POST", f"{base}/events/bulk-delete",
+                   json={"ids": event_ids})
+
+
+async def drive(session, state, base, mix, rate, seconds, max_in_flight) -> Dict[str, Any]:
+    """
+    Open loop: requests start on a Poisson schedule at `rate` per second
+    whether or not earlier ones finished, so queueing in the server shows
+    up as latency instead of silently lowering the offered load.
+    """
+    rec = Recorder()
+    names, weights = list(mix), list(mix.values())
+    loop = asyncio.get_running_loop()
+    in_flight = set()
+    started = loop.time()
+    next_at = started
+    while next_at < started + seconds:
+        await asyncio.sleep(max(0.0, next_at - loop.time()))
+        if len(in_flight) >= max_in_flight:
+            rec.dropped += 1
+        else:
+            op = state.rng.choices(names, weights)[0]
+            task = asyncio.create_task(OPS[op](session, state, rec, base))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        next_at += state.rng.expovariate(rate)
+    if in_flight:
+        await asyncio.gather(*in_flight)
+    return rec.summary(loop.time() - started)
+
+
+def saturated(step: Dict[str, Any], args) -> bool:
+    return (
+        step["achieved_rps"] < 0.9 * step["target_rps"] * (1 - step["error_rate"])
+        or step["error_rate"] > args.max_error_rate
+        or step["dropped"] > 0
+        or (args.slo_ms is not None and step["p99_ms"] > args.slo_ms)
+    )
+
+
+def git_rev() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> Dict[str, Any]:
+    mix = parse_mix(args.mix)
+    if args.ramp:
+        start, stop, step = (float(v) for v in args.ramp.split(":"))
+        rates = list(np.arange(start, stop + step / 2, step))
+    else:
+        rates = [args.rate]
+    base = args.base_url.rstrip("/")
+    state = State(args.users, args.seed)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.max_in_flight)
+
+    steps = []
+    sustained = saturated_at = None
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        await setup(session, state, base, args.events_per_user, args.seed_photos)
+        try:
+            for rate in rates:
+                rate = round(float(rate), 2)
+                print(f"-> {rate} req/s for {args.step_seconds}s")
+                result = await drive(session, state, base, mix, rate,
+                                     args.step_seconds, args.max_in_flight)
+                step = {"target_rps": rate, **result}
+                steps.append(step)
+                print(f"   achieved {step['achieved_rps']} req/s, p99 {step['p99_ms']} ms, "
+                      f"errors {step['error_rate']:.2%}, dropped {step['dropped']}")
+                if saturated(step, args):
+                    saturated_at = rate
+                    break
+                sustained = rate
+        finally:
+            if not args.keep_data:
+                await cleanup(session, state, base)
+
+    return {
+        "format": REPORT_FORMAT,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_rev": git_rev(),
+        "base_url": base,
+        "config": {
+            "mix": mix,
+            "users": args.users,
+            "events_per_user": args.events_per_user,
+            "seed_photos": args.seed_photos,
+            "step_seconds": args.step_seconds,
+            "max_in_flight": args.max_in_flight,
+            "slo_ms": args.slo_ms,
+            "seed": args.seed,
+        },
+        "saturation": {"max_sustained_rps": sustained, "saturated_at_rps": saturated_at},
+        "steps": steps,
+    }
+
+
+def _delta(old: float, new: float) -> str:
+    if not old:
+        return "    n/a"
+    return f"{(new - old) / old:+7.1%}"
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any], threshold: float) -> bool:
+    """
+    Prints per-endpoint latency changes for the rates both reports ran;
+    returns False if a p95/p99 or the sustained rate regressed by more than
+    `threshold`.
+    """
+    ok = True
+    print(f"old {old.get('git_rev')} ({old['created_at']})  new {new.get('git_rev')} ({new['created_at']})")
+    a, b = old["saturation"]["max_sustained_rps"], new["saturation"]["max_sustained_rps"]
+    print(f"max sustained req/s: {a} -> {b}")
+    if a and (b or 0) < a * (1 - threshold):
+        ok = False
+
+    new_steps = {s["target_rps"]: s for s in new["steps"]}
+    for old_step in old["steps"]:
+        new_step = new_steps.get(old_step["target_rps"])
+        if new_step is None:
+            continue
+        print(f"\n@ {old_step['target_rps']} req/s")
+        print(f"  {'endpoint':<14}{'p50 ms':>22}{'p95 ms':>30}{'p99 ms':>30}")
+        for op, o in old_step["endpoints"].items():
+            n = new_step["endpoints"].get(op)
+            if n is None:
+                continue
+            cells = []
+            for key in ("p50_ms", "p95_ms", "p99_ms"):
+                cells.append(f"{o[key]:>9.1f} -> {n[key]:<9.1f}{_delta(o[key], n[key])}")
+                if key != "p50_ms" and o[key] and n[key] > o[key] * (1 + threshold):
+                    ok = False
+            print(f"  {op:<14}" + "  ".join(cells))
+    return ok
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="generate load and write a report")
+    p.add_argument("--base-url", default="http://127.0.0.1:8000")
+    p.add_argument("--rate", type=float, default=10.0, help="requests per second")
+    p.add_argument("--ramp", help="start:stop:step req/s; stops at the first saturated step")
+    p.add_argument("--step-seconds", type=float, default=30.0)
+    p.add_argument("--mix", default=DEFAULT_MIX, help="op=weight,... of " + ",".join(OPS))
+    p.add_argument("--users", type=int, default=20)
+    p.add_argument("--events-per-user", type=int, default=2)
+    p.add_argument("--seed-photos", type=int, default=100, help="uploads before measuring")
+    p.add_argument("--max-in-flight", type=int, default=512)
+    p.add_argument("--timeout", type=float, default=30.0)
+    p.add_argument("--slo-ms", type=float, help="p99 above this counts as saturated")
+    p.add_argument("--max-error-rate", type=float, default=0.01)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--keep-data", action="store_true", help="do not delete the created events")
+    p.add_argument("--out", default="loadtest-report.json")
+
+    c = sub.add_parser("compare", help="diff two reports")
+    c.add_argument("old")
+    c.add_argument("new")
+    c.add_argument("--threshold", type=float, default=0.10,
+                   help="relative regression that fails the comparison")
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        return 0 if compare(old, new, args.threshold) else 1
+
+    report = asyncio.run(run(args))
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    sat = report["saturation"]
+    print(f"max sustained {sat['max_sustained_rps']} req/s, "
+          f"saturated at {sat['saturated_at_rps']} req/s; report in {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
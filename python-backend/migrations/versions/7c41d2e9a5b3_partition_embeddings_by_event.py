@@ -0,0 +1,156 @@
+"""partition embeddings by event
+
+Brings a database created by an earlier version up to the current models:
+the columns added since (events.version, images.media_type/phash/
+duplicate_of, embeddings.quality/timestamp), embeddings rebuilt as a table
+hash-partitioned on a denormalized event_id, and subscription_matches
+pointing at its (id, event_id) key. Runs in one transaction and locks the
+tables while it copies; plan a maintenance window.
+
+Revision ID: 7c41d2e9a5b3
+Revises: 4ef9d38e7881
+Create Date: 2026-10-19 09:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.models import EMBEDDING_IVF_LISTS, EMBEDDING_PARTITIONS
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c41d2e9a5b3'
+down_revision: Union[str, None] = '4ef9d38e7881'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(name: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not _has_table("images"):
+        # empty database: the API's create_all builds the current schema
+        return
+
+    # columns added by later models (user-027/031/034/046)
+    op.execute("ALTER TABLE events ADD COLUMN IF NOT EXISTS version integer NOT NULL DEFAULT 0")
+    op.execute(
+        "ALTER TABLE images ADD COLUMN IF NOT EXISTS media_type varchar NOT NULL DEFAULT 'image'")
+    op.execute("ALTER TABLE images ADD COLUMN IF NOT EXISTS phash bigint")
+    op.execute(
+        "ALTER TABLE images ADD COLUMN IF NOT EXISTS duplicate_of integer "
+        "REFERENCES images (id) ON DELETE SET NULL")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_images_duplicate_of ON images (duplicate_of)")
+
+    relkind = op.get_bind().execute(
+        sa.text("SELECT relkind FROM pg_class WHERE oid = to_regclass('embeddings')")
+    ).scalar()
+    if relkind == "r":
+        _partition_embeddings()
+
+    if _has_table("subscription_matches"):
+        _rebuild_subscription_matches()
+
+
+def _partition_embeddings() -> None:
+    # 1) the old table keeps its rows until they are copied; its indexes
+    #    are dropped or renamed so their names are free for the new table
+    op.execute("ALTER TABLE embeddings RENAME TO embeddings_legacy")
+    op.execute("ALTER TABLE embeddings_legacy RENAME CONSTRAINT embeddings_pkey TO embeddings_legacy_pkey")
+    for index in ("idx_embeddings_vector_ivf", "ix_embeddings_id",
+                  "ix_embeddings_image_id", "ix_embeddings_quality"):
+        op.execute(f"DROP INDEX IF EXISTS {index}")
+    op.execute("ALTER TABLE embeddings_legacy ADD COLUMN IF NOT EXISTS quality double precision")
+    op.execute('ALTER TABLE embeddings_legacy ADD COLUMN IF NOT EXISTS "timestamp" double precision')
+
+    # 2) the partitioned table, reusing the id sequence so ids are kept
+    op.execute(
+        """
+        CREATE TABLE embeddings (
+            id integer NOT NULL DEFAULT nextval('embeddings_id_seq'::regclass),
+            event_id integer NOT NULL REFERENCES events (id) ON DELETE CASCADE,
+            image_id integer NOT NULL REFERENCES images (id),
+            x double precision NOT NULL,
+            y double precision NOT NULL,
+            w double precision NOT NULL,
+            h double precision NOT NULL,
+            vector vector(512),
+            quality double precision,
+            "timestamp" double precision,
+            PRIMARY KEY (id, event_id)
+        ) PARTITION BY HASH (event_id)
+        """
+    )
+    for remainder in range(EMBEDDING_PARTITIONS):
+        op.execute(
+            f"CREATE TABLE embeddings_p{remainder} PARTITION OF embeddings "
+            f"FOR VALUES WITH (MODULUS {EMBEDDING_PARTITIONS}, REMAINDER {remainder})"
+        )
+
+    # 3) copy with event_id backfilled from the image
+    op.execute(
+        """
+        INSERT INTO embeddings (id, event_id, image_id, x, y, w, h, vector, quality, "timestamp")
+        SELECT e.id, i.event_id, e.image_id, e.x, e.y, e.w, e.h, e.vector, e.quality, e."timestamp"
+        FROM embeddings_legacy e JOIN images i ON i.id = e.image_id
+        """
+    )
+    op.execute("ALTER SEQUENCE embeddings_id_seq OWNED BY embeddings.id")
+    # CASCADE also drops subscription_matches' single-column foreign key
+    op.execute("DROP TABLE embeddings_legacy CASCADE")
+
+    # 4) indexes built once over the copied rows (one ivfflat per partition)
+    op.execute("CREATE INDEX ix_embeddings_id ON embeddings (id)")
+    op.execute("CREATE INDEX ix_embeddings_image_id ON embeddings (image_id)")
+    op.execute("CREATE INDEX ix_embeddings_quality ON embeddings (quality)")
+    op.execute(
+        "CREATE INDEX idx_embeddings_vector_ivf ON embeddings USING ivfflat (vector) "
+        f"WITH (lists = {EMBEDDING_IVF_LISTS})"
+    )
+
+
+def _rebuild_subscription_matches() -> None:
+    op.execute(
+        "ALTER TABLE subscription_matches "
+        "DROP CONSTRAINT IF EXISTS subscription_matches_embedding_id_fkey")
+    op.execute("ALTER TABLE subscription_matches ADD COLUMN IF NOT EXISTS event_id integer")
+    op.execute(
+        """
+        UPDATE subscription_matches m SET event_id = s.event_id
+        FROM subscriptions s
+        WHERE s.id = m.subscription_id AND m.event_id IS NULL
+        """
+    )
+    # matches whose face is gone would fail the new foreign key
+    op.execute(
+        """
+        DELETE FROM subscription_matches m
+        WHERE NOT EXISTS (
+            SELECT 1 FROM embeddings e
+            WHERE e.id = m.embedding_id AND e.event_id = m.event_id
+        )
+        """
+    )
+    op.execute("ALTER TABLE subscription_matches ALTER COLUMN event_id SET NOT NULL")
+    op.execute(
+        "ALTER TABLE subscription_matches "
+        "DROP CONSTRAINT IF EXISTS subscription_matches_embedding_id_event_id_fkey")
+    op.execute(
+        """
+        ALTER TABLE subscription_matches
+        ADD CONSTRAINT subscription_matches_embedding_id_event_id_fkey
+        FOREIGN KEY (embedding_id, event_id)
+        REFERENCES embeddings (id, event_id) ON DELETE CASCADE
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # the old single-table layout is not rebuilt; restore a backup instead
+    raise NotImplementedError("partition_embeddings_by_event cannot be downgraded")
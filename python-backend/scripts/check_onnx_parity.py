@@ -0,0 +1,120 @@
+"""
+Parity check of the ONNX backend against DeepFace on a folder of photos:
+the same face crops are embedded by the Keras ArcFace and by the ONNX
+export, and every pair of vectors must stay within --tolerance (cosine
+distance), far below the match threshold, so vectors stored by one
+backend stay searchable with queries embedded by the other. Detection is
+compared too: share of Keras RetinaFace boxes found again by the ONNX
+detector (IoU >= 0.5). Before that, a fresh process with FACE_BACKEND=onnx
+warms up and embeds the first photo, to check the backend starts cold
+without the Keras RetinaFace.
+
+    python -m scripts.check_onnx_parity photos/ [--int8] [--tolerance 0.02]
+
+Exits non-zero when a tolerance is exceeded.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+# run in a new interpreter, so nothing is cached by DeepFace yet
+COLD_START = """
+import sys
+from deepface.modules import modeling
+from app import face_lib
+face_lib.warm_up()
+faces = face_lib.get_embeddings(sys.argv[1])
+detector = modeling.cached_models["face_detector"]["retinaface"].model
+assert type(detector).__name__ == "RetinaFaceSession", type(detector)
+print(f"cold start: {len(faces)} faces")
+"""
+
+
+def iou(a, b) -> float:
+    x1, y1 = max(a["x"], b["x"]), max(a["y"], b["y"])
+    x2 = min(a["x"] + a["w"], b["x"] + b["w"])
+    y2 = min(a["y"] + a["h"], b["y"] + b["h"])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = a["w"] * a["h"] + b["w"] * b["h"] - inter
+    return inter / union if union else 0.0
+
+
+def cold_start(path: str, int8: bool) -> bool:
+    env = dict(os.environ, FACE_BACKEND="onnx", ONNX_INT8="1" if int8 else "0")
+    return subprocess.run([sys.executable, "-c", COLD_START, path], env=env).returncode == 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("images", help="folder of photos with faces")
+    parser.add_argument("--int8", action="store_true", help="check the quantized models")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="max cosine distance between backends (0.02, or 0.05 with --int8)")
+    parser.add_argument("--min-recall", type=float, default=0.98,
+                        help="share of DeepFace boxes the ONNX detector must find")
+    parser.add_argument("--limit", type=int, default=200)
+    args = parser.parse_args()
+    tolerance = args.tolerance if args.tolerance is not None else (0.05 if args.int8 else 0.02)
+
+    # both backends are driven explicitly below; face_lib itself stays on deepface
+    os.environ["FACE_BACKEND"] = "deepface"
+    os.environ["ONNX_INT8"] = "1" if args.int8 else "0"
+    from app import face_lib, onnx_backend
+    from app.thresholds import find_threshold
+    from app.vector_ops import distance_matrix
+
+    paths = sorted(
+        os.path.join(args.images, n) for n in os.listdir(args.images)
+        if n.lower().endswith(IMAGE_EXTENSIONS)
+    )[:args.limit]
+    if not paths:
+        print("No images found")
+        return 1
+    if not cold_start(paths[0], args.int8):
+        print("FAILED: the ONNX backend does not start cold")
+        return 1
+    images = [face_lib.load_image(p) for p in paths]
+
+    # 1) Keras detection and the reference embeddings
+    keras_faces = [face_lib._found_faces(face_lib.detect_faces(img, "retinaface")) for img in images]
+    crops = [obj["face"] for faces in keras_faces for obj in faces]
+    if not crops:
+        print("No faces found, nothing to compare")
+        return 1
+    keras_vecs = np.asarray(face_lib.represent_faces(crops))
+
+    # 2) ONNX embeddings of the very same crops
+    batch = face_lib.preprocess_faces(crops, onnx_backend.arcface_input_size())
+    onnx_vecs = onnx_backend.embed(batch)
+    dists = np.diag(distance_matrix(keras_vecs, onnx_vecs, "cosine"))
+
+    # 3) ONNX detection on the same images
+    onnx_backend.install_retinaface()
+    found = total = 0
+    for img, ref in zip(images, keras_faces):
+        got = face_lib._found_faces(face_lib.detect_faces(img, "retinaface"))
+        total += len(ref)
+        found += sum(
+            any(iou(r["facial_area"], g["facial_area"]) >= 0.5 for g in got) for r in ref)
+    recall = found / total
+
+    threshold = find_threshold("ArcFace", "cosine")
+    print(f"models: {onnx_backend.model_path('arcface')}, {onnx_backend.model_path('retinaface')}")
+    print(f"{len(paths)} images, {len(crops)} faces")
+    print(f"embedding distance keras vs onnx: mean {dists.mean():.5f}  "
+          f"p99 {np.percentile(dists, 99):.5f}  max {dists.max():.5f}  "
+          f"(tolerance {tolerance}, match threshold {threshold})")
+    print(f"detection recall: {recall:.2%} (min {args.min_recall:.0%})")
+
+    ok = dists.max() <= tolerance and recall >= args.min_recall
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+Regression check of the inference scheduler's preemption: many long bulk
+jobs (videos) calling checkpoint() between frames while a stream of
+interactive calls (searches) preempts them. Every job must finish within
+--timeout; a parked job holding a pool thread used to starve the jobs
+holding the slots it waited for.
+
+    python -m scripts.check_scheduler [--videos 8] [--streams 4]
+
+Exits non-zero on a deadlock or a lost job.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from app.scheduler import PriorityScheduler
+
+
+async def scenario(
+    sched: PriorityScheduler, videos: int, frames: int, streams: int, searches: int
+) -> int:
+    def video():
+        for _ in range(frames):
+            time.sleep(0.002)
+            sched.checkpoint("bulk")
+        return "video"
+
+    async def search_stream():
+        done = 0
+        for _ in range(searches):
+            await asyncio.sleep(0.001)
+            done += await sched.run("interactive", time.sleep, 0.001) is None
+        return done
+
+    results = await asyncio.gather(
+        *(sched.run("bulk", video) for _ in range(videos)),
+        *(search_stream() for _ in range(streams)),
+    )
+    return results.count("video") + sum(r for r in results if isinstance(r, int))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--slots", type=int, default=4)
+    parser.add_argument("--reserved", type=int, default=1)
+    parser.add_argument("--videos", type=int, default=8, help="concurrent bulk jobs")
+    parser.add_argument("--frames", type=int, default=100, help="checkpoints per bulk job")
+    parser.add_argument("--streams", type=int, default=4, help="concurrent search streams")
+    parser.add_argument("--searches", type=int, default=200, help="interactive calls per stream")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    sched = PriorityScheduler(slots=args.slots, reserved=args.reserved)
+    expected = args.videos + args.streams * args.searches
+    started = time.monotonic()
+    try:
+        finished = asyncio.run(asyncio.wait_for(
+            scenario(sched, args.videos, args.frames, args.streams, args.searches), args.timeout))
+    except asyncio.TimeoutError:
+        print(f"FAILED: deadlocked after {args.timeout}s, {sched.stats()}")
+        sys.stdout.flush()
+        # the stuck pool threads would block the interpreter's exit
+        os._exit(1)
+
+    print(f"{finished}/{expected} jobs in {time.monotonic() - started:.2f}s, "
+          f"{sched.preemptions} preemptions")
+    ok = finished == expected
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
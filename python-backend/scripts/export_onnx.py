@@ -0,0 +1,49 @@
+"""
+Exports DeepFace's RetinaFace and ArcFace Keras models to ONNX for
+FACE_BACKEND=onnx, each with an int8 variant (dynamic quantization of the
+weights) used when ONNX_INT8=1.
+
+    pip install tf2onnx   # export only, it pins an older protobuf than the app
+    python -m scripts.export_onnx --out models
+
+Check the result with scripts/check_onnx_parity.py before deploying it.
+"""
+import argparse
+import os
+
+
+def export(model, path: str, opset: int) -> None:
+    import tensorflow as tf
+    import tf2onnx
+
+    spec = [tf.TensorSpec(model.input_shape, tf.float32, name="input")]
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=opset, output_path=path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--out", default=os.getenv("ONNX_MODEL_DIR", "models"))
+    parser.add_argument("--opset", type=int, default=13)
+    parser.add_argument("--no-int8", action="store_true", help="skip the quantized variants")
+    args = parser.parse_args()
+
+    from deepface import DeepFace
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    os.makedirs(args.out, exist_ok=True)
+    models = {
+        "arcface": DeepFace.build_model(model_name="ArcFace", task="facial_recognition").model,
+        "retinaface": DeepFace.build_model(model_name="retinaface", task="face_detector").model,
+    }
+    for name, model in models.items():
+        path = os.path.join(args.out, f"{name}.onnx")
+        export(model, path, args.opset)
+        print(f"{name}: {path}")
+        if not args.no_int8:
+            int8_path = os.path.join(args.out, f"{name}.int8.onnx")
+            quantize_dynamic(path, int8_path, weight_type=QuantType.QInt8)
+            print(f"{name} int8: {int8_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Starts a sharded deployment as local processes: N API shards, each with
+its own inference worker (or in-process models with --in-process), and
+the router in front of them. --standby starts extra shards outside the
+ring, to be added through the router to test rebalancing:
+
+    python -m scripts.run_shards --shards 2 --standby 1 --fake
+    curl -X POST localhost:8000/router/shards -H "X-Admin-Token: <ADMIN_TOKEN>" \\
+        -H "Content-Type: application/json" -d '{"url": "http://127.0.0.1:8103"}'
+
+Ctrl-C stops every process. All shards share DATABASE_URL and ADMIN_TOKEN
+(a random one is generated and printed when unset); keep SHARDS, SHARD_URL,
+INFERENCE_URL and ADMIN_TOKEN out of .env.local, it overrides the
+environment set here.
+"""
+import argparse
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import time
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--shards", type=int, default=2, help="shards in the ring")
+    parser.add_argument("--standby", type=int, default=0,
+                        help="extra shards started outside the ring")
+    parser.add_argument("--port", type=int, default=8000, help="router port")
+    parser.add_argument("--shard-port", type=int, default=8101,
+                        help="port of the first shard, the others follow")
+    parser.add_argument("--worker-port", type=int, default=8201,
+                        help="port of the first shard's inference worker")
+    parser.add_argument("--in-process", action="store_true",
+                        help="run the models inside each shard, no workers")
+    parser.add_argument("--fake", action="store_true",
+                        help="INFERENCE_BACKEND=fake, no models (load testing)")
+    parser.add_argument("--db-pool-size", type=int, default=5,
+                        help="DB_POOL_SIZE of each shard")
+    args = parser.parse_args()
+
+    total = args.shards + args.standby
+    shard_urls = [f"http://127.0.0.1:{args.shard_port + i}" for i in range(total)]
+    ring = ",".join(shard_urls[:args.shards])
+    base_env = dict(os.environ, SHARDS=ring)
+    if not base_env.get("ADMIN_TOKEN"):
+        base_env["ADMIN_TOKEN"] = secrets.token_urlsafe(24)
+        print(f"ADMIN_TOKEN={base_env['ADMIN_TOKEN']}")
+    if args.fake:
+        base_env["INFERENCE_BACKEND"] = "fake"
+
+    def uvicorn(target: str, port: int) -> list:
+        return [sys.executable, "-m", "uvicorn", target, "--host", "127.0.0.1", "--port", str(port)]
+
+    procs = []
+    for i, url in enumerate(shard_urls):
+        env = dict(base_env, SHARD_URL=url, DB_POOL_SIZE=str(args.db_pool_size))
+        if args.in_process or args.fake:
+            env["INFERENCE_URL"] = ""
+        else:
+            worker_port = args.worker_port + i
+            env["INFERENCE_URL"] = f"http://127.0.0.1:{worker_port}"
+            procs.append(subprocess.Popen(uvicorn("app.worker:app", worker_port), env=env))
+            print(f"worker {i}: http://127.0.0.1:{worker_port}")
+        procs.append(subprocess.Popen(uvicorn("app.main:app", args.shard_port + i), env=env))
+        print(f"shard {i}: {url}" + ("" if i < args.shards else " (standby)"))
+    procs.append(subprocess.Popen(uvicorn("app.router:app", args.port), env=base_env))
+    print(f"router: http://127.0.0.1:{args.port}")
+
+    try:
+        while all(p.poll() is None for p in procs):
+            time.sleep(1)
+        print("a process exited, stopping the others")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs:
+            if p.poll() is None:
+                p.send_signal(signal.SIGINT)
+        for p in procs:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())